@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals, division
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def add_shifted(counts, plane, dx, dy, wrap=False):
+    """ Add to `counts` the values of `plane` at `dx`, `dy` offset from each cell, i.e. counts[y, x] gets
+        plane[y+dy, x+dx]; cells off the board count as zero unless `wrap`.
+    """
+    if wrap:
+        counts += np.roll(np.roll(plane, -dy, axis=0), -dx, axis=1)
+        return
+    h, w = plane.shape
+    counts[max(0, -dy):h - max(0, dy), max(0, -dx):w - max(0, dx)] += \
+        plane[max(0, dy):h - max(0, -dy), max(0, dx):w - max(0, -dx)]
+
+
+def neighbour_counts(plane, topology, cross=False):
+    """ Array of the number of neighbours of each cell that are true in boolean `plane` (indexed by y, x),
+        or for a numeric plane, the sums of neighbour values, e.g. for influence maps.
+
+        Neighbours are the same as `neighbour_locs()` (with `cross`, `neighbour_cross_locs()`) of a board of
+        `topology`: all of its directions, wrapping around the edges on a torus. The whole plane is shifted
+        once per direction, so it's one pass of vectorized adds rather than a lookup per cell.
+    """
+    if np is None:
+        raise ImportError("neighbour_counts requires numpy")
+    if plane.dtype == bool:
+        plane = plane.view(np.uint8)
+    counts = np.zeros(plane.shape, dtype=plane.dtype)
+    dirs   = [topology.dirs[n] for n in topology.cross] if cross else topology.dirs
+
+    for dir in dirs:
+        even, odd = topology.shifts(dir)
+        if even == odd:
+            add_shifted(counts, plane, even[0], even[1], topology.wrap)
+        else:
+            # hex offset rows: neighbours of even and odd rows are at different offsets
+            for row, (dx, dy) in ((0, even), (1, odd)):
+                shifted = np.zeros_like(counts)
+                add_shifted(shifted, plane, dx, dy, topology.wrap)
+                counts[row::2] += shifted[row::2]
+    return counts
+
+
+def rule_table(born, survive, neighbours=8):
+    """ Rule table of a life-like automaton for `apply_rule()`: dead cells (0) with a number of live
+        neighbours in `born` come to life (1), live cells stay alive with a number in `survive`; e.g.
+        `rule_table((3,), (2, 3))` for Conway's Life.
+    """
+    table = np.zeros((2, neighbours + 1), dtype=np.uint8)
+    table[0, list(born)]    = 1
+    table[1, list(survive)] = 1
+    return table
+
+
+def apply_rule(states, counts, table):
+    """New array of states of all cells: `table[state, count]` of each cell."""
+    return table[states, counts]
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Rendering benchmark: frames per second of a headless PygameBoard, from 3x3 to 200x200 boards, in
+square and circle modes. Each frame places a glyph in a random cell and clears another one.
+
+usage: bench_render.py [frames]
+"""
+from __future__ import print_function, unicode_literals, division
+import sys
+from time import time
+from random import Random
+
+from board import PygameBoard
+
+sizes   = 3, 10, 25, 50, 100, 200
+glyphs  = u'X', u'○'
+nframes = 500
+
+
+def bench(size, circle, nframes):
+    """Return board setup time in seconds, frames per second and the sprite cache hit rate."""
+    tilesize = max(10, min(100, 800 // size))    # smaller circle tiles have no room for the outline
+    start    = time()
+    board    = PygameBoard((size, size), tilesize, glyph_font=(None, tilesize), margin=10, circle=circle,
+                           headless=True, view=(size, size))
+    setup    = time() - start
+
+    rnd   = Random(size)
+    cells = list(board.iterlocs())
+    start = time()
+    for n in range(nframes):
+        with board.transaction():
+            loc = rnd.choice(cells)
+            board.draw_glyph(glyphs[n % 2], board.resolve_loc(loc))
+            board.clear(rnd.choice(cells))
+    fps     = nframes / (time() - start)
+    sprites = board.sprites
+    return setup, fps, sprites.hits / max(1, sprites.hits + sprites.misses)
+
+
+if __name__ == "__main__":
+    arg = sys.argv[1:]
+    if arg: nframes = int(arg[0])
+
+    print("%-9s %-7s %10s %10s %9s" % ("board", "mode", "setup, ms", "fps", "hit rate"))
+    for size in sizes:
+        for circle in (False, True):
+            setup, fps, hits = bench(size, circle, nframes)
+            print("%-9s %-7s %10.1f %10.0f %9.2f" % ("%dx%d" % (size, size), "circle" if circle else "square",
+                                                     setup*1000, fps, hits))
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals, division
+from time import time
+
+from hashing import Zobrist, TranspositionTable, symmetries, inverse
+
+WIN        = 1000           # score of a won position, less the number of plies it takes to win
+MATE_BOUND = WIN - 100      # scores beyond this are wins / losses rather than heuristic estimates
+
+FULL_DEPTH = 1000           # depth of entries searched to the end of the game
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class Timeout(Exception):
+    pass
+
+
+class Bitboard(object):
+    """ Tic-tac-toe position kept as one integer mask per side (bit n is cell `x + y*width`), with
+        precomputed masks of winning lines; `play()` and `undo()` update the position and its Zobrist
+        key in place.
+
+        Zobrist keys are kept for all symmetries of the board that map winning lines onto winning lines
+        (for a square board: rotations and reflections), so that `key()` is the same for all symmetric
+        positions; `canonical()` also tells which symmetry gives the canonical position.
+    """
+    zobrist = {}    # board size -> per side, per cell keys
+
+    def __init__(self, width, height, lines, turn=0):
+        self.width, self.height = width, height
+        self.ncells     = width * height
+        self.all        = (1 << self.ncells) - 1
+        self.masks      = [0, 0]
+        self.turn       = turn      # side to move, 0 or 1
+        self.keys       = self.make_keys()
+        self.line_masks = [sum(1 << i for i in line) for line in lines]
+        self.cell_lines = [[m for m in self.line_masks if m >> i & 1] for i in range(self.ncells)]
+
+        lines         = set(self.line_masks)
+        self.perms    = [p for p in symmetries(width, height) if all(self.permuted(m, p) in lines for m in lines)]
+        self.inverses = [inverse(p) for p in self.perms]
+        self.hashes   = [turn] * len(self.perms)
+
+        # per side, per cell: keys of the cell in each symmetric position, combined with side to move flip
+        self.steps = [[tuple(keys[p[i]] ^ 1 for p in self.perms) for i in range(self.ncells)]
+                      for keys in self.keys]
+
+        # static move order: cells on more lines first
+        self.order = sorted(range(self.ncells), key=lambda i: -len(self.cell_lines[i]))
+
+    def make_keys(self):
+        """Zobrist keys for both sides, shared between bitboards of the same size; bit 0 is reserved for the side to move."""
+        size = self.width, self.height
+        if size not in self.zobrist:
+            z = Zobrist(self.ncells, seed="%dx%d" % size)
+            self.zobrist[size] = [[z(i, side) & ~1 for i in range(self.ncells)] for side in (0, 1)]
+        return self.zobrist[size]
+
+    def permuted(self, mask, perm):
+        return sum(1 << perm[i] for i in range(self.ncells) if mask >> i & 1)
+
+    @classmethod
+    def from_board(cls, board, players, player):
+        """Position of tictactoe `board` with `player` (one of the two `players`) to move."""
+        w   = board.width
+        bb  = cls(w, board.height, [[loc.x + loc.y*w for loc in line] for line in board.win_lines],
+                  players.index(player))
+        for loc in board.iterlocs():
+            if board[loc] is not None:
+                side, i = players.index(board[loc]), loc.x + loc.y*w
+                bb.masks[side] |= 1 << i
+                bb.hashes       = [h ^ bb.keys[side][p[i]] for h, p in zip(bb.hashes, bb.perms)]
+        return bb
+
+    def key(self):
+        """Zobrist key of the canonical symmetric position, including side to move."""
+        return min(self.hashes)
+
+    def canonical(self):
+        """Key of the canonical position and the index of symmetry in `self.perms` that produces it."""
+        hashes = self.hashes
+        key    = min(hashes)
+        return key, hashes.index(key)
+
+    def free(self):
+        return self.all & ~(self.masks[0] | self.masks[1])
+
+    def play(self, i):
+        self.masks[self.turn] |= 1 << i
+        self.hashes = [h ^ k for h, k in zip(self.hashes, self.steps[self.turn][i])]
+        self.turn ^= 1
+
+    def undo(self, i):
+        self.turn ^= 1
+        self.hashes = [h ^ k for h, k in zip(self.hashes, self.steps[self.turn][i])]
+        self.masks[self.turn] &= ~(1 << i)
+
+    def won_at(self, i):
+        """The side that just moved to `i` has completed a line through it."""
+        mask = self.masks[self.turn ^ 1]
+        return any(mask & m == m for m in self.cell_lines[i])
+
+    def win_cells(self, side):
+        """Free cells that would complete a line for `side`."""
+        mine, theirs, cells = self.masks[side], self.masks[side ^ 1], 0
+        for m in self.line_masks:
+            rest = m & ~mine
+            if not m & theirs and rest and not rest & (rest - 1):
+                cells |= rest
+        return cells
+
+    def scan(self):
+        """ Scan all lines once; return win cells of the side to move, win cells of the other side and
+            whether each of them can still win: some line has no marks of the other side and its free
+            cells can be filled with the moves the side has left.
+        """
+        me, opp = self.masks[self.turn], self.masks[self.turn ^ 1]
+        free    = bin(self.all & ~(me | opp)).count("1")
+        my_left, opp_left = (free + 1) // 2, free // 2
+        wins = blocks = 0
+        mine = theirs = False
+
+        for m in self.line_masks:
+            if not m & opp:
+                rest = m & ~me
+                if not rest & (rest - 1):
+                    wins |= rest
+                    mine  = True
+                elif not mine and bin(rest).count("1") <= my_left:
+                    mine = True
+            elif not m & me:
+                rest = m & ~opp
+                if not rest & (rest - 1):
+                    blocks |= rest
+                    theirs  = True
+                elif not theirs and bin(rest).count("1") <= opp_left:
+                    theirs = True
+        return wins, blocks, mine, theirs
+
+    def evaluate(self):
+        """Heuristic score for the side to move: lines open to one side only, weighted by marks."""
+        mine, theirs = self.masks[self.turn], self.masks[self.turn ^ 1]
+        score = 0
+        for m in self.line_masks:
+            if not m & theirs   : score += 1 << 2*bin(m & mine).count("1")
+            elif not m & mine   : score -= 1 << 2*bin(m & theirs).count("1")
+        return max(-MATE_BOUND // 2, min(MATE_BOUND // 2, score))
+
+
+class Searcher(object):
+    """ Negamax search with alpha-beta pruning (principal variation search), a transposition table,
+        move ordering (table move, then wins and blocks at the root, then cells on more lines) and
+        iterative deepening within a time budget.
+
+        The transposition table is kept between searches, so it carries over between AI turns.
+    """
+    check_every = 1024      # nodes between time / cancellation checks
+    solve_cells = 16        # positions with this many free cells or fewer are searched to the end right away
+
+    def __init__(self, table_size=2**17, policy="depth"):
+        self.table = TranspositionTable(table_size, policy)
+
+    def search(self, bb, budget=1.0, cancel=None):
+        """ Return best cell index for the side to move in `bb`, searching for up to `budget` seconds;
+            `cancel` is an optional threading.Event that stops the search early.
+        """
+        self.deadline = time() + budget
+        self.cancel   = cancel
+        self.nodes    = 0
+        free   = bb.free()
+        best   = next(i for i in bb.order if free >> i & 1)
+        empty  = bin(free).count("1")
+        depths = list(range(1, empty + 1))
+        if empty <= self.solve_cells:
+            # heuristic iterations would cost more than they save in move ordering
+            depths = depths[:2] + [empty]
+
+        self.depth, self.score = 0, None
+        for depth in depths:
+            try:
+                score, move = self.root(bb, depth)
+            except Timeout:
+                break
+            best, self.depth, self.score = move, depth, score
+            if abs(score) > MATE_BOUND:
+                break
+        return best
+
+    def root(self, bb, depth):
+        """Search the root position to `depth` plies; return score and best move."""
+        alpha, beta = -WIN - 1, WIN + 1
+        best = None
+        key, sym = bb.canonical()
+        for n, i in enumerate(self.ordered(bb, self.table_move(bb, key, sym), root=True)):
+            bb.play(i)
+            try:
+                if bb.won_at(i):
+                    score = WIN - 1
+                elif n == 0:
+                    score = -self.negamax(bb, depth-1, -beta, -alpha, 1)
+                else:
+                    score = -self.negamax(bb, depth-1, -alpha-1, -alpha, 1)
+                    if score > alpha:
+                        score = -self.negamax(bb, depth-1, -beta, -alpha, 1)
+            finally:
+                bb.undo(i)
+            if best is None or score > alpha:
+                alpha, best = max(alpha, score), i
+        self.store(bb, key, sym, depth, alpha, EXACT, best, 0)
+        return alpha, best
+
+    def negamax(self, bb, depth, alpha, beta, ply):
+        self.nodes += 1
+        if not self.nodes % self.check_every:
+            if time() > self.deadline or (self.cancel and self.cancel.is_set()):
+                raise Timeout
+
+        free = bb.free()
+        if not free:
+            return 0
+
+        # immediate win, or forced block; two cells to block is a loss
+        wins, block, mine, theirs = bb.scan()
+        if wins:
+            return WIN - ply - 1
+        if block & (block - 1):
+            return -(WIN - ply - 2)
+
+        # if one of the sides can't win anymore, the result is bounded by a draw
+        if not mine and (not theirs or alpha >= 0):
+            return 0
+        if not theirs and beta <= 0:
+            return 0
+        if depth <= 0:
+            return bb.evaluate()
+
+        # a search to the end of the game stays valid in later, deeper iterations
+        if depth >= bin(free).count("1"):
+            depth = FULL_DEPTH
+
+        key, sym = bb.canonical()
+        entry    = self.table.get(key)
+        tmove    = None
+        if entry:
+            edepth, value, flag, tmove = entry
+            if tmove is not None:
+                tmove = bb.inverses[sym][tmove]
+            if edepth >= depth:
+                value = self.from_table(value, ply)
+                if flag == EXACT                      : return value
+                elif flag == LOWER and value >= beta  : return value
+                elif flag == UPPER and value <= alpha : return value
+
+        # no move here can complete a line: `scan()` would have found it as a win cell
+        orig_alpha = alpha
+        best, best_move = -WIN - 1, None
+        moves = [block.bit_length() - 1] if block else self.ordered(bb, tmove)
+        for n, i in enumerate(moves):
+            bb.play(i)
+            try:
+                if n == 0:
+                    score = -self.negamax(bb, depth-1, -beta, -alpha, ply+1)
+                else:
+                    score = -self.negamax(bb, depth-1, -alpha-1, -alpha, ply+1)
+                    if alpha < score < beta:
+                        score = -self.negamax(bb, depth-1, -beta, -alpha, ply+1)
+            finally:
+                bb.undo(i)
+
+            if score > best:
+                best, best_move = score, i
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        flag = UPPER if best <= orig_alpha else LOWER if best >= beta else EXACT
+        self.store(bb, key, sym, depth, best, flag, best_move, ply)
+        return best
+
+    def ordered(self, bb, tmove=None, root=False):
+        """ Free cells of `bb` in search order: table move, then (at the root, where they are not
+            handled by the search itself) wins and blocks, then cells that are on more lines.
+        """
+        free  = bb.free()
+        moves = [i for i in bb.order if free >> i & 1]
+        if root:
+            wins  = bb.win_cells(bb.turn) & free
+            block = bb.win_cells(bb.turn ^ 1) & free
+            moves.sort(key=lambda i: (not wins >> i & 1, not block >> i & 1))
+        if tmove is not None and tmove in moves:
+            moves.remove(tmove)
+            moves.insert(0, tmove)
+        return moves
+
+    def table_move(self, bb, key, sym):
+        """Best move stored for the position, mapped back from the canonical position."""
+        entry = self.table.get(key)
+        if entry and entry[3] is not None:
+            return bb.inverses[sym][entry[3]]
+
+    def store(self, bb, key, sym, depth, value, flag, move, ply):
+        """Store search result, with `move` mapped to the canonical position."""
+        if move is not None:
+            move = bb.perms[sym][move]
+        self.table.put(key, depth, self.to_table(value, ply), flag, move)
+
+    def to_table(self, value, ply):
+        """Mate scores are stored relative to the position rather than to the root."""
+        if value > MATE_BOUND    : return value + ply
+        elif value < -MATE_BOUND : return value - ply
+        return value
+
+    def from_table(self, value, ply):
+        if value > MATE_BOUND    : return value - ply
+        elif value < -MATE_BOUND : return value + ply
+        return value
@@ -1,16 +1,30 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, unicode_literals, division
+import os
 import sys
 import math
-from time import sleep
+import threading
+from time import sleep, time as now   # `time` is taken by pygame.time
+from contextlib import contextmanager
 from random import choice as randchoice
 from pprint import pprint
+from inspect import getmro
+from collections import OrderedDict, deque
 
 import pygame
 from pygame import *
 from pygame import font, display, gfxdraw
 
-from utils import ujoin, range1, enumerate1, first, nl, space, iround
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from utils import range1, enumerate1, first, nl, space, iround, sentinel
+from hashing import Zobrist, symmetries
+from pathfinding import astar, DistanceMaps
+from topology import Square
+import automata
 
 red        = (255,0,0)
 green      = (0,255,0)
@@ -23,9 +37,36 @@ lgray      = (170,170,170)
 black      = (0,0,0)
 pink       = (255,200,200)
 
+AI_DONE    = USEREVENT + 1      # posted by `AIWorker` with `token`, `result` and `error` attributes
+
 def pploc(loc):
     return loc.x+1, loc.y+1
 
+def tile_value(tile):
+    """ Hashable value of `tile` for position keys: value-like tiles (strings, None, numbers) as they are;
+        tile objects as their class with public attributes other than `loc` and `board`, so that tiles in the
+        same state get the same key, and changing a tile in place changes it. Unhashable attribute values
+        are taken by identity.
+    """
+    try:
+        attrs = vars(tile)
+    except TypeError:
+        return tile
+    values = []
+    for name, value in sorted(attrs.items()):
+        if name.startswith("_") or name in ("loc", "board"):
+            continue
+        try:
+            hash(value)
+        except TypeError:
+            value = type(value).__name__, id(value)
+        values.append((name, value))
+    return tile.__class__.__name__, tuple(values)
+
+def blocks_sight(tile):
+    """Default `fov()` test: tiles with a true `blocks` attribute block line of sight."""
+    return getattr(tile, "blocks", False)
+
 def center_square(loc, size):
     r = Rect(0, 0, size, size)
     r.center = loc
@@ -40,21 +81,64 @@ class BaseTile(object):
         setattr(self, self.__class__.__name__.lower(), True)
 
 
+class FlyweightTile(object):
+    """ Mixin for tile classes of boards with `flyweight` set: all cells that have the default tile
+        share one instance. Looking up such a cell returns a view of the shared tile: an instance of the
+        tile class that reads the shared tile's attributes and has a `loc` of its own, so views of
+        different cells (e.g. from `tiles()` or iteration) can be kept and used side by side.
+
+        Writing any attribute other than `loc` of a view first gives its cell its own tile
+        (copy-on-write), so e.g. `board[loc].piece = piece` works as with per-cell tiles. Tiles need a
+        `board` attribute.
+    """
+    _shared = False
+    _views  = {}        # tile class -> class of views of its shared tile
+
+    def __setattr__(self, name, value):
+        if self._shared and name != "loc":
+            self = self.board.promote(self.loc)
+        object.__setattr__(self, name, value)
+
+    def view(self, loc):
+        """View of this (shared) tile at `loc`: its attributes, with `loc` kept in a slot of the view."""
+        cls  = self.__class__
+        vcls = FlyweightTile._views.get(cls)
+        if vcls is None:
+            vcls = FlyweightTile._views[cls] = type(str(cls.__name__), (cls,), {"__slots__": ("loc",)})
+        view = object.__new__(vcls)
+        object.__setattr__(view, "__dict__", self.__dict__)
+        object.__setattr__(view, "loc", loc)
+        return view
+
+
 class Loc(object):
     """ Location on game board; note that we should not modify the location in place to avoid many
         hard to track errors; `moved()` creates and returns a new instance.
+
+        Boards hand out interned locations (see `BaseBoard.getloc()`), so there is a single
+        instance per board coordinate and most comparisons are identity checks.
     """
+    __slots__ = ("x", "y")
+
     def __init__(self, x, y):
-        self.loc = x, y
         self.x, self.y = x, y
 
+    @property
+    def loc(self):
+        return self.x, self.y
+
     def __repr__(self):
         return str(self.loc)
 
     def __iter__(self):
-        return iter(self.loc)
+        yield self.x
+        yield self.y
 
     def __eq__(self, other):
+        if other is self:
+            return True
+        if isinstance(other, Loc):
+            return self.x == other.x and self.y == other.y
         return self.loc == getattr(other, "loc", None)
 
     def __ne__(self, other):
@@ -71,19 +155,109 @@ class Loc(object):
 
 Dir = Loc   # Directions (e.g. 0,1=right) work the same way but should have a different name for clarity
 
+_loc_tables       = {}  # interned locations, shared by all boards of the same size
+_step_tables      = {}  # per-cell tuples of next locations in each direction, keyed by topology and board size
+_adjacency_tables = {}  # per-cell tuples of neighbour locations, keyed by topology, board size and neighbourhood
+_ray_tables       = {}  # per-cell tuples of rays in each direction, keyed by topology and board size
+
+# octant transforms for shadowcasting: xx, xy, yx, yy
+_octants = [(1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+            (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1)]
+
+class SparseTable(dict):
+    """Per-cell table of a very large board, used in place of a list; cells not set are None."""
+    def __missing__(self, i):
+        return None
+
+
+# operations in move journal undo records, see `BaseBoard.push()`
+SET, BLANK, PUSHED, REMOVED, MOVED = range(5)
+
+class TerminalRenderer(object):
+    """ Draws text frames on a terminal. A frame is a list of lines, each a list of cell strings joined
+        with spaces. Only cells that changed since the previous frame are written, using ANSI cursor
+        moves, and the whole frame goes out in a single write. A line whose cells changed width is
+        rewritten whole.
+
+        If the stream is not a terminal, every frame is written whole, after `screen_sep` newlines.
+    """
+    def __init__(self, stream=None, screen_sep=5):
+        self.stream     = stream or sys.stdout
+        self.ansi       = bool(getattr(self.stream, "isatty", None) and self.stream.isatty())
+        self.screen_sep = screen_sep
+        self.prev       = None      # lines of the previous frame
+        self.last_frame = None      # end of the previous `wait()`, or start of the first frame
+
+    def render(self, lines):
+        """ Draw `lines`, leaving the cursor below them, with the rest of the screen cleared, so that status
+            text can be printed there.
+        """
+        if self.last_frame is None:
+            self.last_frame = now()
+        if not self.ansi:
+            out = [nl * self.screen_sep] + [space.join(line) + nl for line in lines]
+        elif self.prev is None:
+            out = ["\x1b[2J\x1b[H"] + [space.join(line) + nl for line in lines]
+        else:
+            out = []
+            for row, line in enumerate(lines, 1):
+                prev = self.prev[row-1] if row <= len(self.prev) else None
+                if line == prev:
+                    continue
+                if prev is None or len(line) != len(prev) or any(len(a) != len(b) for a, b in zip(line, prev)):
+                    out.append("\x1b[%d;1H%s\x1b[K" % (row, space.join(line)))
+                    continue
+                col = 1
+                for cell, old in zip(line, prev):
+                    if cell != old:
+                        out.append("\x1b[%d;%dH%s" % (row, col, cell))
+                    col += len(cell) + 1
+            out.append("\x1b[%d;1H\x1b[J" % (len(lines) + 1))
+
+        self.prev = lines
+        self.stream.write("".join(out))
+        self.stream.flush()
+
+    def wait(self, budget):
+        """ Sleep for what's left of `budget` seconds since the end of the previous wait (or the start of
+            the first frame; the whole budget if nothing was rendered yet).
+        """
+        left = budget if self.last_frame is None else self.last_frame + budget - now()
+        if left > 0:
+            sleep(left)
+        self.last_frame = now()
+
+
 class BaseBoard(object):
     """ Base Board for regular and stackable boards.
 
-        TODO: add various scrolling and visual area options.
+        See `PygameBoard` for scrolling and zooming of boards larger than the window.
     """
     stackable         = False
     board_initialized = False
-
-    def __init__(self, size, num_grid=False, padding=(0, 0), pause_time=0.2, screen_sep=5):
+    index             = None    # attribute -> set of locations, see `enable_index()`
+    zobrist           = None    # see `enable_hashing()`
+    key               = 0
+    sym_perms         = None    # cell permutations of board symmetries, see `enable_hashing()`
+    journal           = None    # undo records of `push()` and `apply()`
+    dense_limit       = 2**20   # boards with more cells use sparse location and adjacency tables
+    flyweight         = False   # share one default tile between cells, see `FlyweightTile`
+    renderer          = None    # `TerminalRenderer` used by `draw()`
+    fov_cache         = None    # (origin, radius, blocks) -> visible locations, see `fov()`
+    fov_cache_size    = 64      # most recently used fields of view kept in `fov_cache`
+    fov_deps          = None    # location -> keys of `fov_cache` entries that include it
+    distance_maps     = None    # `pathfinding.DistanceMaps` cache, see `distance_map()`
+    topology_cls      = Square  # board geometry, see `topology` module
+    shared_tile       = sentinel    # set by `make_shared_tile()`
+    _spares           = None    # default tiles released by `pop()`, reused by `apply()`
+
+    def __init__(self, size, num_grid=False, padding=(0, 0), pause_time=0.2, screen_sep=5, topology_cls=None):
         if isinstance(size, int):
             size = size, size   # handle square board
 
         self.width, self.height = size
+        self.topology_cls = topology_cls or self.topology_cls
+        self.topology     = self.topology_cls(self.width, self.height)
 
         self.num_grid    = num_grid
         self.xpad        = padding[0]
@@ -93,24 +267,182 @@ class BaseBoard(object):
         self.init_tiles  = False
 
         self.tiletpl     = "%%%ds" % (padding[0] + 1)
+        self.make_locs()
         self.directions()
+        self.make_adjacency()
 
     def __iter__(self):
-        return ( self[Loc(x, y)] for y in range(self.height) for x in range(self.width) )
+        return ( self[loc] for loc in self.iterlocs() )
+
+    def make_locs(self):
+        """Set up the table of interned locations; boards of the same size share one table."""
+        size = self.width, self.height
+        if size not in _loc_tables:
+            _loc_tables[size] = self.make_table()
+        self._locs = _loc_tables[size]
+
+    def make_table(self):
+        """Empty per-cell table, a list or for very large boards a `SparseTable`."""
+        n = self.width * self.height
+        return [None] * n if n <= self.dense_limit else SparseTable()
+
+    def make_adjacency(self):
+        """ Set up tables of steps, all-way and 'cross' adjacency and rays; like locations, they are shared
+            between boards of the same topology and size, and each cell's entry is filled in on first lookup.
+        """
+        key = self.topology_cls, self.width, self.height
+        for tables, attr in ((_step_tables, "_steps"), (_ray_tables, "_rays")):
+            if key not in tables:
+                tables[key] = self.make_table()
+            setattr(self, attr, tables[key])
+
+        for n, attr in ((8, "_adj8"), (4, "_adj4")):
+            if key + (n,) not in _adjacency_tables:
+                _adjacency_tables[key + (n,)] = self.make_table()
+            setattr(self, attr, _adjacency_tables[key + (n,)])
+
+    def step_locs(self, loc):
+        """ Return tuple of locations one step from `loc` in each of `dirlist2` directions, with None for
+            steps off the board.
+        """
+        i    = loc.y*self.width + loc.x
+        locs = self._steps[i]
+        if locs is None:
+            x, y, step = loc.x, loc.y, self.topology.step
+            locs = self._steps[i] = tuple(self.getloc(*step(x, y, d)) for d in self.dirlist2)
+        return locs
+
+    def adjacent(self, loc, table, dirs):
+        """Return tuple of valid locations next to `loc` in `dirs` directions, cached in `table`."""
+        i    = loc.y*self.width + loc.x
+        locs = table[i]
+        if locs is None:
+            steps = self.step_locs(loc)
+            locs  = table[i] = tuple(l for l in (steps[self.dirindex[d]] for d in dirs) if l)
+        return locs
+
+    def getloc(self, x, y):
+        """Return the interned location at `x`, `y`, or None if it's outside of the board."""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            i   = y*self.width + x
+            loc = self._locs[i]
+            if loc is None:
+                loc = self._locs[i] = Loc(x, y)
+            return loc
+
+    def iterlocs(self):
+        """Generate all interned locations, row by row."""
+        w, locs = self.width, self._locs
+        for i in range(w * self.height):
+            loc = locs[i]
+            if loc is None:
+                loc = locs[i] = Loc(i % w, i // w)
+            yield loc
 
     def tiles(self, *attrs):
+        locs = self.indexed(attrs)
+        if locs is not None:
+            return [self[l] for l in locs]
         return [ t for t in self if all(getattr(t, attr) for attr in attrs) ]
 
     def tiles_not(self, *attrs):
         return [ t for t in self if all(not getattr(t, attr) for attr in attrs) ]
 
     def locations(self, *attrs):
-        locs = (Loc(x, y) for y in range(self.height) for x in range(self.width))
-        return [ l for l in locs if all(getattr(self[l], attr) for attr in attrs) ]
+        locs = self.indexed(attrs)
+        if locs is not None:
+            return list(locs)
+        return [ l for l in self.iterlocs() if all(getattr(self[l], attr) for attr in attrs) ]
 
     def locations_not(self, *attrs):
-        locs = (Loc(x, y) for y in range(self.height) for x in range(self.width))
-        return [ l for l in locs if all(not getattr(self[l], attr) for attr in attrs) ]
+        return [ l for l in self.iterlocs() if all(not getattr(self[l], attr) for attr in attrs) ]
+
+    def enable_index(self, *attrs):
+        """ Keep a set of locations per each of boolean tile `attrs`, so that `tiles()` and `locations()`
+            queries on these attributes don't need to scan the board (results are in no particular
+            order). Board writes update the index; tile flags changed in place need a `touch()` call.
+        """
+        self.index = dict((attr, set()) for attr in attrs)
+        self.reindex()
+
+    def reindex(self):
+        """Rebuild the attribute index and position key from scratch."""
+        self.rehash()
+        if self.index:
+            for locs in self.index.values():
+                locs.clear()
+            for loc in self.iterlocs():
+                self.touch(loc)
+
+    def touch(self, loc):
+        """Update the attribute index and position key after the tile at `loc` was written or had a flag changed."""
+        if self.zobrist is not None:
+            self.hash_cell(loc)
+        if self.fov_cache:
+            self.invalidate_fov(loc)
+        if self.distance_maps:
+            self.distance_maps.invalidate(loc)
+        if self.index:
+            loc  = self.getloc(loc.x, loc.y)
+            tile = self[loc]
+            for attr, locs in self.index.items():
+                if getattr(tile, attr, False) : locs.add(loc)
+                else                          : locs.discard(loc)
+
+    def enable_hashing(self, tile_key=None, seed=None, symmetric=False):
+        """ Keep a Zobrist key of the position in `self.key`, updated incrementally on each board write
+            or `touch()`; `tile_key` maps a tile to a hashable value (by default, `tile_value()`).
+
+            With `symmetric`, also keep keys of all rotated / reflected positions, see `canonical_key()`.
+        """
+        self.zobrist   = Zobrist(self.width * self.height, seed)
+        self.tile_key  = tile_key or tile_value
+        self.sym_perms = symmetries(self.width, self.height) if symmetric else [None]
+        self.rehash()
+
+    def rehash(self):
+        """Recalculate the position key from scratch."""
+        if self.zobrist is not None:
+            if not self.board_initialized:
+                self.init_board()       # hashes the initial position with `reindex()`
+                return
+            self.key       = 0
+            self.sym_keys  = [0] * len(self.sym_perms)
+            self.cell_keys = [(0,) * len(self.sym_perms)] * (self.width * self.height)
+            for loc in self.iterlocs():
+                self.hash_cell(loc)
+
+    def hash_cell(self, loc):
+        """Replace the old key of `loc` cell in the position key (and its symmetric keys) by its current key."""
+        i, tile_key = loc.y*self.width + loc.x, self.tile_key
+        if self.stackable : values = [(tile_key(item), depth) for depth, item in enumerate(self.items(loc))]
+        else              : values = [tile_key(self[loc])]
+
+        new = []
+        for perm in self.sym_perms:
+            j, key = (perm[i] if perm else i), 0
+            for value in values:
+                key ^= self.zobrist(j, value)
+            new.append(key)
+
+        old               = self.cell_keys[i]
+        self.cell_keys[i] = tuple(new)
+        self.sym_keys     = [k ^ o ^ n for k, o, n in zip(self.sym_keys, old, new)]
+        self.key          = self.sym_keys[0]
+
+    def canonical_key(self):
+        """ Key shared by all rotations and reflections of the position (the smallest of their keys), for
+            caches and opening books that store one entry per symmetric group of positions; requires
+            `enable_hashing(symmetric=True)`.
+        """
+        return min(self.sym_keys)
+
+    def indexed(self, attrs):
+        """Set of locations where all of `attrs` are true, or None if `attrs` are not all indexed."""
+        index = self.index
+        if index and attrs and all(attr in index for attr in attrs):
+            sets = sorted((index[attr] for attr in attrs), key=len)
+            return sets[0].intersection(*sets[1:])
 
     def ploc(self, tile_loc):
         """Parse location out of tile-or-loc `tile_loc`."""
@@ -119,109 +451,402 @@ class BaseBoard(object):
         else                         : return tile_loc.loc
 
     def draw(self, pause=None):
+        """ Draw the board on the terminal with `self.renderer`, which only redraws cells that changed, then
+            wait for the rest of the frame: frames are `pause` (by default, `pause_time`) seconds apart.
+        """
         pause = pause or self.pause_time
-        print(nl * self.screen_sep)
+        if not self.renderer:
+            self.renderer = TerminalRenderer(screen_sep=self.screen_sep)
 
+        tpl, lines = self.tiletpl, []
+        padding    = [[]] * self.ypad
         if self.num_grid:
-            print(space, space*(self.xpad + 1), ujoin( range1(self.width), space, self.tiletpl ), nl * self.ypad)
+            lines.append([space, space*(self.xpad + 1)] + [tpl % n for n in range1(self.width)])
+            lines.extend(padding)
 
-        for n, row in enumerate1(self.board):
-            args = [self.tiletpl % n] if self.num_grid else []
-            if self.stackable:
-                row = (tile[-1] for tile in row)
-            args = [space] + args + [ujoin(row, space, self.tiletpl), nl * self.ypad]
-            print(*args)
+        for n, row in enumerate1(self.topitems() if self.stackable else self.rows()):
+            lines.append([space] + ([tpl % n] if self.num_grid else []) + [tpl % tile for tile in row])
+            lines.extend(padding)
 
+        self.renderer.render(lines)
         self.status()
-        sleep(pause)
+        self.renderer.wait(pause)
 
     def status(self):
         pass
 
+    def rows(self):
+        """Return board rows, as stored (i.e. stacks for a stackable board)."""
+        self.init_board()
+        return self.board
+
     def valid(self, loc):
         return bool( loc.x >= 0 and loc.y >= 0 and loc.x <= self.width-1 and loc.y <= self.height-1 )
 
     def directions(self):
-        """Create list and dict of eight directions, going from up clockwise."""
-        dirs          = [(0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)]
-        self.dirlist  = [Dir(*d) for d in (dirs[0], dirs[2], dirs[4], dirs[6])]
-        self.dirlist2 = [Dir(*d) for d in dirs]
-        self.dirnames = dict(zip(self.dirlist2, "up ru right rd down ld left lu".split()))
+        """ Create lists and dicts of directions of the board's topology: for square boards, eight directions
+            going from up clockwise, and four 'cross' directions in `dirlist`.
+        """
+        topology      = self.topology
+        self.dirlist2 = [Dir(*d) for d in topology.dirs]
+        self.dirlist  = [self.dirlist2[n] for n in topology.cross]
+        self.dirnames = dict(zip(self.dirlist2, topology.dirnames))
+        self.dirindex = dict((d, n) for n, d in enumerate(self.dirlist2))
 
     def neighbour_locs(self, tile_loc):
-        """Return the list of neighbour locations of `tile`."""
-        x, y = self.ploc(tile_loc)
-        coords = (-1,0,1)
-        locs = set((x+n, y+m) for n in coords for m in coords) - set( [(x,y)] )
-        locs = [ Loc(*tpl) for tpl in locs if self.valid(Loc(*tpl)) ]
-        return [loc for loc in locs if self[loc] is not None]
+        """Return the tuple of neighbour locations of `tile`."""
+        return self.adjacent(self.ploc(tile_loc), self._adj8, self.dirlist2)
 
     def neighbours(self, tile_loc):
         """Return the list of neighbours of `tile`."""
         return [self[loc] for loc in self.neighbour_locs(tile_loc)]
 
     def neighbour_cross_locs(self, tile_loc):
-        """Return a generator of neighbour 'cross' (i.e. no diagonal) locations of `tile`."""
-        x, y = self.ploc(tile_loc)
-        locs = ((x-1, y), (x+1, y), (x, y-1), (x, y+1))
-        locs = [ Loc(*tpl) for tpl in locs if self.valid(Loc(*tpl)) ]
-        return [loc for loc in locs if self[loc] is not None]
+        """Return the tuple of neighbour 'cross' (i.e. no diagonal) locations of `tile`."""
+        return self.adjacent(self.ploc(tile_loc), self._adj4, self.dirlist)
 
     def cross_neighbours(self, tile_loc):
         """Return the generator of 'cross' (i.e. no diagonal) neighbours of `tile`."""
         return (self[loc] for loc in self.neighbour_cross_locs(tile_loc))
 
+    def plane(self, match):
+        """ Boolean array, indexed by y, x, of cells holding tile `match` or, if it's callable, holding tiles
+            `match(tile)` is true for.
+        """
+        if np is None:
+            raise ImportError("plane requires numpy")
+        test  = match if callable(match) else (lambda tile: tile == match)
+        cells = [bool(test(self[loc])) for loc in self.iterlocs()]
+        return np.array(cells, dtype=bool).reshape(self.height, self.width)
+
+    def neighbour_counts(self, match, cross=False):
+        """ Array of the number of neighbours of each cell matching `match` (see `plane()`), counted for
+            the whole board at once; with `cross`, only 'cross' neighbours. See `automata.neighbour_counts()`.
+        """
+        return automata.neighbour_counts(self.plane(match), self.topology, cross)
+
+    def apply_rule(self, rule, match, cross=False):
+        """ Update all cells at once by `rule`, a dict of tile -> sequence of tiles it turns into with 0, 1, 2...
+            neighbours matching `match` (see `plane()`); tiles not in `rule`, or with more neighbours than
+            their sequence covers, stay. Return the number of changed cells.
+        """
+        counts  = self.neighbour_counts(match, cross).tolist()
+        changes = []
+        for loc in self.iterlocs():
+            tile = self[loc]
+            new  = rule.get(tile)
+            n    = counts[loc.y][loc.x]
+            if new and n < len(new) and new[n] != tile:
+                changes.append((loc, new[n]))
+        for loc, tile in changes:
+            self[loc] = tile
+        return len(changes)
+
+    def tracks_writes(self):
+        """Board keeps an index, position key or cache that `touch()` updates, so bulk writes need to call it."""
+        return self.zobrist is not None or bool(self.index or self.fov_cache or self.distance_maps)
+
     def make_tile(self, loc, **kwargs):
         """Make a tile using `self.def_tile`. If def_tile is simply a string, return it, otherwise instantiate with x, y as arguments."""
         tile = self.def_tile
-        return tile if self._def_tile_str or tile is None else tile(self, loc, **kwargs)
+        if self._def_tile_str or tile is None:
+            return tile
+        if self.flyweight and not kwargs:
+            shared = self.shared_tile
+            return shared if shared is not sentinel else self.make_shared_tile()
+        return tile(self, loc, **kwargs)
+
+    def make_shared_tile(self):
+        """Make the default tile shared by cells of a `flyweight` board."""
+        tile = self.def_tile(self, None)
+        if not isinstance(tile, FlyweightTile):
+            raise TypeError("tiles of a flyweight board should be FlyweightTile instances")
+        object.__setattr__(tile, "_shared", True)
+        self.shared_tile = tile
+        return tile
+
+    def promote(self, loc):
+        """Replace the shared tile at `loc` with a tile of the cell's own; return the new tile."""
+        tile = self.def_tile(self, loc)
+        if self.stackable:
+            stack = self.items(loc)
+            stack[next(n for n, t in enumerate(stack) if getattr(t, "_shared", False))] = tile
+            self.touch(loc)
+        else:
+            self[loc] = tile
+        return tile
+
+    def is_def_tile(self, tile):
+        """`tile` is an instance of the `def_tile` class (and so can be reused at another location)."""
+        return not self._def_tile_str and self.def_tile is not None and isinstance(tile, self.def_tile)
+
+    def reuse_tile(self, loc):
+        """ Return default tile for `loc`: one released by `pop()`, with its location updated, or a new one
+            from `make_tile()` (the shared tile of a flyweight board); tiles displaced by other moves are
+            not reused, as they may have per-cell state.
+        """
+        tile = self._spares.pop() if self._spares else None
+        if tile is None:
+            return self.make_tile(loc)
+        if hasattr(tile, "loc"):
+            tile.loc = loc
+        return tile
 
     def move(self, tile_loc, newloc):
         loc          = self.ploc(tile_loc)
         item         = self[loc]
         self[newloc] = item
-        self[loc]    = self.make_tile(loc)
+        self[loc]    = self.reuse_tile(loc)
 
         if hasattr(item, "loc"):
             item.loc = newloc
 
-    def nextloc(self, tile_loc, dir, n=1, wrap=False):
-        """Return location next to `tile_loc` point in direction `dir`."""
+    def push(self, tile_loc, item):
+        """ Put `item` at `tile_loc` (on top of the stack for a stackable board), recording the change in
+            the move journal; return the undo record, see `pop()`.
+        """
         loc = self.ploc(tile_loc)
+        if self.stackable : undo = [(PUSHED, loc)]
+        else              : undo = [(SET, loc, self[loc])]
+        self[loc] = item
+        return self.record(undo)
+
+    def apply(self, tile_loc, newloc):
+        """ Move like `move()`, recording the change in the move journal; return the undo record, see
+            `pop()`. The vacated cell gets a default tile released by an earlier `pop()` when there is
+            one, so that a search that applies and pops moves doesn't create new tiles.
+        """
+        loc    = self.ploc(tile_loc)
+        newloc = self.ploc(newloc)
+        if self.stackable:
+            item  = self[loc] if isinstance(tile_loc, Loc) else tile_loc
+            stack = self.items(loc)
+            i     = next(n for n, x in enumerate(stack) if x is item)
+            undo  = [(PUSHED, newloc), (REMOVED, loc, i, item)]
+            self[newloc] = item
+            del stack[i]
+            self.touch(loc)
+        else:
+            item  = self[loc]
+            undo  = [(SET, newloc, self[newloc]), (BLANK, loc, item)]
+            self[newloc] = item
+            self[loc]    = self.reuse_tile(loc)
+
+        if hasattr(item, "loc"):
+            undo.append((MOVED, item, item.loc))
+            item.loc = newloc
+        return self.record(undo)
 
-        x   = loc.x + dir.x*n
-        y   = loc.y + dir.y*n
+    def record(self, undo):
+        if self.journal is None:
+            self.journal, self._spares = [], []
+        self.journal.append(undo)
+        return undo
 
-        if wrap:
-            while not self.valid(Loc(x,y)):
-                if x > (self.width - 1)  : x -= self.width
-                elif x < 0               : x += self.width
+    def pop(self):
+        """ Undo the last `push()` or `apply()`: restore changed cells, stacks and item locations; return
+            its undo record.
+        """
+        undo = self.journal.pop()
+        for op in reversed(undo):
+            kind = op[0]
+            if kind == SET:
+                self[op[1]] = op[2]
+            elif kind == BLANK:
+                tile        = self[op[1]]
+                self[op[1]] = op[2]
+                if self.is_def_tile(tile):
+                    self._spares.append(tile)
+            elif kind == PUSHED:
+                del self[op[1]]
+            elif kind == REMOVED:
+                self.items(op[1]).insert(op[2], op[3])
+                self.touch(op[1])
+            elif kind == MOVED:
+                op[1].loc = op[2]
+        return undo
 
-                if y > (self.height - 1) : y -= self.height
-                elif y < 0               : y += self.height
+    def nextloc(self, tile_loc, dir, n=1, wrap=False):
+        """ Return location `n` steps from `tile_loc` point in direction `dir`, or None if it's off the board;
+            with `wrap`, coordinates wrap around the edges (on a torus, they always do).
+        """
+        loc = self.ploc(tile_loc)
+        if n == 1 and not wrap and dir in self.dirindex:
+            return self.step_locs(loc)[self.dirindex[dir]]
 
-        loc = Loc(x, y)
-        return loc if self.valid(loc) else None
+        x, y = self.topology.step(loc.x, loc.y, dir, n)
+        if wrap:
+            x, y = x % self.width, y % self.height
+        return self.getloc(x, y)
 
     def next_tile(self, tile_loc, dir, n=1):
         loc = self.nextloc(tile_loc, dir, n)
         return self[loc] if loc else None
 
     def dist(self, tile_loc1, tile_loc2):
+        """Distance between tiles as measured by the board's topology; Euclidean on square boards."""
         l1, l2 = self.ploc(tile_loc1), self.ploc(tile_loc2)
-        return math.sqrt( abs(l2.x - l1.x)**2 + abs(l2.y - l1.y)**2  )
+        return self.topology.dist(l1.x, l1.y, l2.x, l2.y)
 
     def ray(self, tile, dir, n=0):
         """ Generate a 'ray' of tiles from `tile` start in `dir` direction for `n` tiles; if n is
-            0, to the end of board, excluding `start`.
+            0, to the end of board (on a torus, until it comes back to `start`), excluding `start`.
         """
+        if dir in self.dirindex:
+            locs = self.ray_locs(tile)[self.dirindex[dir]]
+            for loc in locs[:n] if n else locs:
+                tile = self[loc]
+                if not tile:
+                    break
+                yield tile
+            return
+
+        start = loc = self.ploc(tile)
         while True:
-            tile = self.next_tile(tile, dir)
+            loc  = self.nextloc(loc, dir)
+            tile = self[loc] if loc and loc != start else None
             if tile   : yield tile
             else      : break
             if n == 1 : break
             if n: n -= 1
 
+    def ray_locs(self, tile_loc):
+        """ Tuple of rays of locations from `tile_loc` to the edge of the board (on a torus, until they come
+            back to the start), excluding the start, in `dirlist2` order; rays are precomputed per topology,
+            board size and cell, on first use.
+        """
+        loc  = self.ploc(tile_loc)
+        i    = loc.y*self.width + loc.x
+        rays = self._rays[i]
+        if rays is None:
+            loc  = self.getloc(loc.x, loc.y)
+            rays = []
+            for n in range(len(self.dirlist2)):
+                ray, nloc = [], self.step_locs(loc)[n]
+                while nloc and nloc is not loc:
+                    ray.append(nloc)
+                    nloc = self.step_locs(nloc)[n]
+                rays.append(tuple(ray))
+            rays = self._rays[i] = tuple(rays)
+        return rays
+
+    def rays(self, tile_loc, n=0, stop=None):
+        """ List of rays of tiles from `tile_loc` in `dirlist2` order, for `n` tiles (if n is 0, to the
+            end of board); with `stop` predicate, each ray ends with the first tile `stop(tile)` is true
+            for, e.g. the first piece in the way of a sliding piece.
+        """
+        rays = []
+        for locs in self.ray_locs(tile_loc):
+            tiles = []
+            for loc in locs[:n] if n else locs:
+                tile = self[loc]
+                tiles.append(tile)
+                if stop and stop(tile):
+                    break
+            rays.append(tiles)
+        return rays
+
+    def fov(self, tile_loc, radius=0, blocks=None):
+        """ Set of locations visible from `tile_loc` within `radius` (0 for the whole board), using
+            recursive shadowcasting; `blocks(tile)` tells if a tile blocks sight (by default,
+            `blocks_sight()`). Blocking tiles are visible themselves. Sight lines follow square grid
+            geometry, with board edges blocking sight on any topology.
+
+            Results are cached per origin, radius and `blocks` function, until a board write or
+            `touch()` changes a cell in the visible set; up to `fov_cache_size` of the most recently
+            used ones are kept.
+        """
+        origin = self.ploc(tile_loc)
+        origin = self.getloc(origin.x, origin.y)
+        radius = radius or self.width + self.height
+        blocks = blocks or blocks_sight
+        key    = origin, radius, blocks
+        if self.fov_cache is None:
+            self.fov_cache, self.fov_deps = OrderedDict(), {}
+        cache   = self.fov_cache
+        visible = cache.pop(key, None)
+        if visible is None:
+            visible = set([origin])
+            for octant in _octants:
+                self.cast_light(origin, visible, blocks, radius, 1, 1.0, 0.0, octant)
+            visible = frozenset(visible)
+            if len(cache) >= self.fov_cache_size:
+                self.forget_fov(next(iter(cache)))
+            deps = self.fov_deps
+            for loc in visible:
+                keys = deps.get(loc)
+                if keys is None:
+                    keys = deps[loc] = set()
+                keys.add(key)
+        cache[key] = visible
+        return visible
+
+    def cast_light(self, origin, visible, blocks, radius, row, start, end, octant):
+        """Scan one octant of `fov()` from `row` between `start` and `end` slopes, adding lit cells to `visible`."""
+        if start < end:
+            return
+        xx, xy, yx, yy = octant
+        getloc, r2     = self.getloc, radius*radius
+        new_start      = start
+
+        for j in range(row, radius+1):
+            dx, dy  = -j-1, -j
+            blocked = False
+            while dx <= 0:
+                dx += 1
+                loc = getloc(origin.x + dx*xx + dy*xy, origin.y + dx*yx + dy*yy)
+                l_slope, r_slope = (dx-0.5) / (dy+0.5), (dx+0.5) / (dy-0.5)
+                if start < r_slope:
+                    continue
+                elif end > l_slope:
+                    break
+
+                if loc and dx*dx + dy*dy <= r2:
+                    visible.add(loc)
+                opaque = loc is None or blocks(self[loc])
+                if blocked:
+                    if opaque:
+                        new_start = r_slope
+                    else:
+                        blocked = False
+                        start   = new_start
+                elif opaque and j < radius:
+                    blocked = True
+                    self.cast_light(origin, visible, blocks, radius, j+1, start, l_slope, octant)
+                    new_start = r_slope
+            if blocked:
+                break
+
+    def in_sight(self, tile_loc1, tile_loc2, radius=0, blocks=None):
+        """`tile_loc2` is visible from `tile_loc1`, see `fov()`."""
+        return self.ploc(tile_loc2) in self.fov(tile_loc1, radius, blocks)
+
+    def path(self, tile_loc1, tile_loc2, passable=None, cross=False, cost=None):
+        """List of locations of the shortest path from `tile_loc1` to `tile_loc2`, or None; see `pathfinding.astar()`."""
+        return astar(self, tile_loc1, tile_loc2, passable, cross, cost)
+
+    def distance_map(self, sources, passable=None, cross=False, cost=None):
+        """ Array of distances from the nearest of `sources`, indexed by y, x; see `pathfinding.distance_map()`.
+            Maps are cached until a write or `touch()` changes a cell they depend on.
+        """
+        if self.distance_maps is None:
+            self.distance_maps = DistanceMaps(self)
+        return self.distance_maps.get(sources, passable, cross, cost)
+
+    def invalidate_fov(self, loc):
+        """Drop cached fields of view that include `loc`."""
+        for key in list(self.fov_deps.get(loc, ())):
+            self.forget_fov(key)
+
+    def forget_fov(self, key):
+        """Drop the cached field of view under `key` and its entries in `fov_deps`."""
+        deps = self.fov_deps
+        for loc in self.fov_cache.pop(key):
+            keys = deps[loc]
+            keys.discard(key)
+            if not keys:
+                del deps[loc]
+
     def reset(self):
         self.board_initialized = False
         self.init_board()
@@ -235,23 +860,31 @@ class Board(BaseBoard):
         except NameError : self._def_tile_str = isinstance(def_tile, str)
 
         self.def_tile = def_tile
-        xrng, yrng    = range(self.width), range(self.height)
-        self.board    = [ [None for x in xrng] for y in yrng ]
+        self.make_storage()
+
+    def make_storage(self):
+        xrng, yrng = range(self.width), range(self.height)
+        self.board = [ [None for x in xrng] for y in yrng ]
 
     def __getitem__(self, loc):
-        if isinstance(loc, tuple):
-            loc = Loc(loc[0], loc[1])
         self.init_board()
-        return self.board[loc.y][loc.x]
+        if isinstance(loc, tuple):
+            loc = self.getloc(*loc)
+        tile = self.board[loc.y][loc.x]
+        if tile is self.shared_tile:
+            tile = tile.view(loc)
+        return tile
 
     def __setitem__(self, tile_loc, item):
         self.init_board()
         loc = self.ploc(tile_loc)
         self.board[loc.y][loc.x] = item
+        self.touch(loc)
 
     def __delitem__(self, tile_loc):
         loc = self.ploc(tile_loc)
         self.board[loc.y][loc.x] = self.make_tile(loc)
+        self.touch(loc)
 
     def empty(self, tile_loc):
         loc = self.ploc(tile_loc)
@@ -268,11 +901,173 @@ class Board(BaseBoard):
         if not self.board_initialized:
             self.board_initialized = True
             xrng, yrng = range(self.width), range(self.height)
-            self.board = [ [self.make_tile(Loc(x, y)) for x in xrng] for y in yrng ]
+            getloc     = self.getloc
+            if self._def_tile_str or self.def_tile is None:
+                # value tiles don't depend on the location
+                self.board = [ [self.def_tile] * self.width for y in yrng ]
+            else:
+                self.board = [ [self.make_tile(getloc(x, y)) for x in xrng] for y in yrng ]
+            self.reindex()
+
+
+class NumpyBoard(Board):
+    """ Board that stores tiles as integer codes in a NumPy array; each distinct tile value gets a code
+        and attribute queries are answered with per-attribute boolean planes, e.g. `mask("blank")`.
+
+        Tiles should be value-like (strings, None or shared tile instances): tile attributes are read
+        once per code, so changing a tile in place is not reflected in queries.
+
+        To use with a pygame board, mix it in after the pygame class, e.g.:
+            class NumpyTictactoeBoard(TictactoeBoard, NumpyBoard): pass
+    """
+    def __init__(self, size, def_tile, **kwargs):
+        if np is None:
+            raise ImportError("NumpyBoard requires numpy")
+        super(NumpyBoard, self).__init__(size, def_tile, **kwargs)
+
+    def make_storage(self):
+        self.board       = None
+        self.codes       = np.zeros((self.height, self.width), dtype=np.int32)
+        self.code_tiles  = []       # code -> tile
+        self.tile_codes  = {}       # tile -> code
+        self.attr_tables = {}       # attribute -> boolean array indexed by code
+
+    def __getitem__(self, loc):
+        self.init_board()
+        if isinstance(loc, tuple):
+            return self.code_tiles[self.codes[loc[1], loc[0]]]
+        return self.code_tiles[self.codes[loc.y, loc.x]]
+
+    def __setitem__(self, tile_loc, item):
+        self.init_board()
+        loc = self.ploc(tile_loc)
+        self.codes[loc.y, loc.x] = self.code(item)
+        self.touch(loc)
+
+    def __delitem__(self, tile_loc):
+        loc = self.ploc(tile_loc)
+        self.codes[loc.y, loc.x] = self.code(self.make_tile(loc))
+        self.touch(loc)
+
+    def init_board(self):
+        if not self.board_initialized:
+            self.board_initialized = True
+            if self._def_tile_str or self.def_tile is None:
+                self.codes[:] = self.code(self.def_tile)
+            else:
+                for loc in self.iterlocs():
+                    self.codes[loc.y, loc.x] = self.code(self.make_tile(loc))
+            self.reindex()
+
+    def rows(self):
+        tiles = self.code_tiles
+        return [ [tiles[c] for c in row] for row in self.codes.tolist() ]
+
+    def code(self, tile):
+        """Return integer code of `tile`, registering it if it wasn't seen before."""
+        try:
+            return self.tile_codes[tile]
+        except KeyError:
+            code = self.tile_codes[tile] = len(self.code_tiles)
+            self.code_tiles.append(tile)
+            self.attr_tables.clear()
+            return code
+
+    def attr_table(self, attr):
+        """Return boolean array of `attr` values indexed by tile code."""
+        table = self.attr_tables.get(attr)
+        if table is None:
+            table = [bool(getattr(t, attr, False)) for t in self.code_tiles]
+            table = self.attr_tables[attr] = np.array(table, dtype=bool)
+        return table
+
+    def mask(self, *attrs):
+        """Boolean plane of cells where all of `attrs` are true."""
+        self.init_board()
+        mask = np.ones(self.codes.shape, dtype=bool)
+        for attr in attrs:
+            mask &= self.attr_table(attr)[self.codes]
+        return mask
+
+    def mask_not(self, *attrs):
+        """Boolean plane of cells where none of `attrs` are true."""
+        self.init_board()
+        mask = np.ones(self.codes.shape, dtype=bool)
+        for attr in attrs:
+            mask &= ~self.attr_table(attr)[self.codes]
+        return mask
+
+    def tile_mask(self, tile):
+        """Boolean plane of cells holding `tile`."""
+        self.init_board()
+        return self.codes == self.code(tile)
+
+    def plane(self, match):
+        """Boolean plane of cells holding tile `match` or, if it's callable, tiles `match(tile)` is true for."""
+        if not callable(match):
+            return self.tile_mask(match)
+        self.init_board()
+        table = np.array([bool(match(t)) for t in self.code_tiles], dtype=bool)
+        return table[self.codes]
+
+    def apply_rule(self, rule, match, cross=False):
+        """ Update all cells at once by `rule`, see `BaseBoard.apply_rule()`; the rule is turned into a table
+            of codes indexed by code and neighbour count, so the update is a single array lookup.
+        """
+        self.init_board()
+        counts = self.neighbour_counts(match, cross)
+        rule   = dict((self.code(t), [self.code(n) for n in new]) for t, new in rule.items())
+        width  = len(self.dirlist if cross else self.dirlist2) + 1
+        table  = np.repeat(np.arange(len(self.code_tiles), dtype=self.codes.dtype)[:, None], width, axis=1)
+        for code, new in rule.items():
+            n = min(len(new), width)
+            table[code, :n] = new[:n]
+
+        codes   = automata.apply_rule(self.codes, counts, table)
+        changed = codes != self.codes
+        self.codes[:] = codes
+        if self.tracks_writes():
+            getloc = self.getloc
+            for x, y in np.argwhere(changed)[:, ::-1].tolist():
+                self.touch(getloc(x, y))
+        return int(changed.sum())
+
+    def coords(self, *attrs):
+        """Array of x, y rows of cells where all of `attrs` are true."""
+        return np.argwhere(self.mask(*attrs))[:, ::-1]
+
+    def coords_not(self, *attrs):
+        """Array of x, y rows of cells where none of `attrs` are true."""
+        return np.argwhere(self.mask_not(*attrs))[:, ::-1]
+
+    def tiles(self, *attrs):
+        tiles = self.code_tiles
+        return [tiles[c] for c in self.codes[self.mask(*attrs)].tolist()]
+
+    def tiles_not(self, *attrs):
+        tiles = self.code_tiles
+        return [tiles[c] for c in self.codes[self.mask_not(*attrs)].tolist()]
+
+    def locations(self, *attrs):
+        getloc = self.getloc
+        return [getloc(x, y) for x, y in self.coords(*attrs).tolist()]
+
+    def locations_not(self, *attrs):
+        getloc = self.getloc
+        return [getloc(x, y) for x, y in self.coords_not(*attrs).tolist()]
 
 
 class StackableBoard(BaseBoard):
+    """ Board where each cell has a stack of items, the top one being the visible tile.
+
+        Besides the stacks, the board keeps per-cell type layers: for each class of the items on a cell
+        (including base classes), the list of its instances in stack order, so that `get_instance()` and
+        `instances()` don't need to scan the stack. Layers are built for a cell on first lookup and
+        rebuilt on writes; `instance_locs()` builds them for the whole board, along with an index of
+        cells per class.
+    """
     stackable = True
+    type_locs = None    # class -> set of locations with instances of the class, see `instance_locs()`
 
     def __init__(self, size, def_tile, **kwargs):
         super(StackableBoard, self).__init__(size, **kwargs)
@@ -281,21 +1076,30 @@ class StackableBoard(BaseBoard):
         except NameError : self._def_tile_str = isinstance(def_tile, str)
 
         self.def_tile = def_tile
-        xrng, yrng    = range(self.width), range(self.height)
-        self.board    = [ [[None] for x in xrng] for y in yrng ]
+        self.layers   = {}      # location -> {class: instances on the cell}
+        self.make_storage()
+
+    def make_storage(self):
+        xrng, yrng = range(self.width), range(self.height)
+        self.board = [ [[None] for x in xrng] for y in yrng ]
 
     def __getitem__(self, loc):
         self.init_board()
-        return self.board[loc.y][loc.x][-1]
+        tile = self.board[loc.y][loc.x][-1]
+        if tile is self.shared_tile:
+            tile = tile.view(loc)
+        return tile
 
     def __setitem__(self, tile_loc, item):
         self.init_board()
         loc = self.ploc(tile_loc)
         self.board[loc.y][loc.x].append(item)
+        self.touch(loc)
 
     def __delitem__(self, tile_loc):
         loc = self.ploc(tile_loc)
         del self.board[loc.y][loc.x][-1]
+        self.touch(loc)
 
     def empty(self, tile_loc):
         return len( self.items(self.ploc(tile_loc)) ) == 1
@@ -304,31 +1108,374 @@ class StackableBoard(BaseBoard):
         if not self.board_initialized:
             self.board_initialized = True
             xrng, yrng = range(self.width), range(self.height)
-            self.board = [ [ [self.make_tile( Loc(x, y) )] for x in xrng] for y in yrng ]
+            getloc     = self.getloc
+            self.board = [ [ [self.make_tile( getloc(x, y) )] for x in xrng] for y in yrng ]
+            self.reindex()
 
     def items(self, tile_loc):
         loc = self.ploc(tile_loc)
         return self.board[loc.y][loc.x]
 
+    def reindex(self):
+        self.layers, self.type_locs = {}, None
+        super(StackableBoard, self).reindex()
+
+    def touch(self, loc):
+        """Update indexes after the stack at `loc` was changed, including the cell's type layer."""
+        super(StackableBoard, self).touch(loc)
+        if self.type_locs is not None or loc in self.layers:
+            self.make_layer(loc)
+
+    def make_layer(self, loc):
+        """(Re)build the type layer of the cell at `loc` from its stack and update `type_locs`; return it."""
+        self.init_board()
+        layer = {}
+        for item in self.items(loc):
+            for cls in getmro(item.__class__):
+                if cls is not object:
+                    layer.setdefault(cls, []).append(item)
+
+        type_locs = self.type_locs
+        if type_locs is not None:
+            old = self.layers.get(loc, ())
+            for cls in old:
+                if cls not in layer:
+                    type_locs[cls].discard(loc)
+            for cls in layer:
+                if cls not in old:
+                    type_locs.setdefault(cls, set()).add(loc)
+        self.layers[loc] = layer
+        return layer
+
+    def layer(self, tile_loc):
+        loc   = self.ploc(tile_loc)
+        layer = self.layers.get(loc)
+        return layer if layer is not None else self.make_layer(loc)
+
+    def instances(self, cls, tile_loc):
+        """List of instances of `cls` at `tile_loc` location, bottom to top."""
+        return list(self.layer(tile_loc).get(cls, ()))
+
     def get_instance(self, cls, tile_loc, default=None):
         """Get first instance of `cls` from `tile_loc` location."""
-        return first([i for i in self.items(tile_loc) if isinstance(i, cls)], default)
+        instances = self.layer(tile_loc).get(cls)
+        return instances[0] if instances else default
+
+    def layer_locs(self):
+        return self.iterlocs()
+
+    def instance_locs(self, cls):
+        """List of locations that have instances of `cls` (in no particular order)."""
+        if self.type_locs is None:
+            self.init_board()
+            self.type_locs = {}
+            self.layers    = {}
+            for loc in self.layer_locs():
+                self.make_layer(loc)
+        return list(self.type_locs.get(cls, ()))
+
+    def topitems(self):
+        """Rows of top items of the stacks, i.e. the visible tiles."""
+        return [ [stack[-1] for stack in row] for row in self.rows() ]
 
     def move(self, tile_loc, newloc):
         item = self[tile_loc] if isinstance(tile_loc, Loc) else tile_loc
 
-        loc = self.ploc(tile_loc)
+        loc   = self.ploc(tile_loc)
         self[newloc] = item
-        self.items(loc).remove(item)
+        stack = self.items(loc)
+        del stack[next(n for n, x in enumerate(stack) if x is item)]
+        self.touch(loc)
 
         if hasattr(item, "loc"):
             item.loc = newloc
 
 
+class SpriteCache(object):
+    """ LRU cache of pre-rendered surfaces (glyphs, pieces, message text), keeping at most `size` of
+        them; `hits` and `misses` count lookups.
+    """
+    def __init__(self, size=256):
+        self.size    = size
+        self.sprites = OrderedDict()
+        self.hits    = self.misses = 0
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def get(self, key, render):
+        """Return surface cached under `key`, rendering it with `render()` on a miss."""
+        sprite = self.sprites.pop(key, None)
+        if sprite is None:
+            self.misses += 1
+            sprite = render()
+            if len(self.sprites) >= self.size:
+                self.sprites.popitem(last=False)
+        else:
+            self.hits += 1
+        self.sprites[key] = sprite
+        return sprite
+
+    def clear(self):
+        self.sprites.clear()
+        self.hits = self.misses = 0
+
+
+class AIWorker(object):
+    """ Runs AI move computation in a background thread, so that the UI loop keeps running; the result
+        is posted as an `AI_DONE` event. Only one computation runs at a time: starting a new one cancels
+        the previous one, and its result is ignored by `PygameBoard.run_ai()`, as it has an older token.
+    """
+    def __init__(self):
+        self.token     = 0
+        self.cancelled = None
+
+    def start(self, func, *args, **kwargs):
+        """ Start `func(*args, cancel=<threading.Event>, **kwargs)`; `func` should return soon after
+            `cancel` is set. Return the token of the computation.
+        """
+        self.cancel()
+        self.token    += 1
+        self.cancelled = cancel = threading.Event()
+
+        def run(token=self.token):
+            result = error = None
+            try:
+                result = func(*args, cancel=cancel, **kwargs)
+            except Exception as e:
+                error = e
+            event.post(event.Event(AI_DONE, token=token, result=result, error=error))
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return self.token
+
+    def cancel(self):
+        if self.cancelled:
+            self.cancelled.set()
+
+
+class Chunked(object):
+    """ Storage of cells in `chunk_size` x `chunk_size` chunks that are allocated on first write, for
+        very large boards; mixed into `ChunkedBoard` and `ChunkedStackableBoard`.
+
+        Cells that were never written have the default tile: with a string (or None) `def_tile`, it's
+        shared by all of them; with a tile class, a tile is made on first access of the cell. Cells of
+        chunks that were not allocated are skipped by `written_locs()`, and by `tiles()` / `locations()`
+        queries that the shared default tile does not match.
+    """
+    chunk_bits = 5              # chunks are 32 x 32 cells
+    chunks     = None           # (x, y) chunk index -> flat list of cells, `sentinel` if never written
+
+    def make_storage(self):
+        self.board      = None
+        self.chunks     = {}
+        self.chunk_size = 1 << self.chunk_bits
+
+    def shared_default(self):
+        """Default tile shared by all unwritten cells, or `sentinel` if each cell gets its own."""
+        if self._def_tile_str or self.def_tile is None or self.flyweight:
+            return self.make_tile(None)
+        return sentinel
+
+    def get_cell(self, loc):
+        """Stored value of cell at `loc`, or `sentinel` if it was never written."""
+        bits  = self.chunk_bits
+        chunk = self.chunks.get((loc.x >> bits, loc.y >> bits))
+        if chunk is None:
+            return sentinel
+        mask = self.chunk_size - 1
+        return chunk[(loc.y & mask) << bits | loc.x & mask]
+
+    def set_cell(self, loc, value):
+        bits, key = self.chunk_bits, (loc.x >> self.chunk_bits, loc.y >> self.chunk_bits)
+        chunk     = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = [sentinel] * (self.chunk_size ** 2)
+        mask = self.chunk_size - 1
+        chunk[(loc.y & mask) << bits | loc.x & mask] = value
+
+    def init_board(self):
+        if not self.board_initialized:
+            self.board_initialized = True
+            self.reindex()
+
+    def written_locs(self):
+        """Generate locations of cells that were written, or accessed with per-cell default tiles, chunk by chunk."""
+        size, getloc = self.chunk_size, self.getloc
+        for cx, cy in sorted(self.chunks, key=lambda k: (k[1], k[0])):
+            chunk = self.chunks[cx, cy]
+            for i, value in enumerate(chunk):
+                if value is not sentinel:
+                    loc = getloc(cx*size + i % size, cy*size + i // size)
+                    if loc:
+                        yield loc
+
+    def skips_unwritten(self, attrs, negated=False):
+        """ Query for tiles with all of `attrs` (with `negated`, with none of them) can skip unwritten cells:
+            there is a shared default tile and it doesn't match; with per-cell default tiles, it can't.
+        """
+        default = self.shared_default()
+        if default is sentinel:
+            return False
+        values = [bool(getattr(default, attr, False)) for attr in attrs]
+        return any(values) if negated else not all(values)
+
+    def tiles(self, *attrs):
+        if self.indexed(attrs) is not None or not self.skips_unwritten(attrs):
+            return super(Chunked, self).tiles(*attrs)
+        tiles = (self[loc] for loc in self.written_locs())
+        return [ t for t in tiles if all(getattr(t, attr) for attr in attrs) ]
+
+    def tiles_not(self, *attrs):
+        if not self.skips_unwritten(attrs, negated=True):
+            return super(Chunked, self).tiles_not(*attrs)
+        tiles = (self[loc] for loc in self.written_locs())
+        return [ t for t in tiles if all(not getattr(t, attr) for attr in attrs) ]
+
+    def locations(self, *attrs):
+        if self.indexed(attrs) is not None or not self.skips_unwritten(attrs):
+            return super(Chunked, self).locations(*attrs)
+        return [ l for l in self.written_locs() if all(getattr(self[l], attr) for attr in attrs) ]
+
+    def locations_not(self, *attrs):
+        if not self.skips_unwritten(attrs, negated=True):
+            return super(Chunked, self).locations_not(*attrs)
+        return [ l for l in self.written_locs() if all(not getattr(self[l], attr) for attr in attrs) ]
+
+
+class ChunkedBoard(Chunked, Board):
+    """Board with chunked sparse storage, see `Chunked`."""
+    def __getitem__(self, loc):
+        self.init_board()
+        if isinstance(loc, tuple):
+            loc = self.getloc(*loc)
+        tile = self.get_cell(loc)
+        if tile is sentinel:
+            tile = self.shared_default()
+            if tile is sentinel:
+                tile = self.make_tile(loc)
+                self.set_cell(loc, tile)
+        if tile is self.shared_tile:
+            tile = tile.view(loc)
+        return tile
+
+    def __setitem__(self, tile_loc, item):
+        self.init_board()
+        loc = self.ploc(tile_loc)
+        self.set_cell(loc, item)
+        self.touch(loc)
+
+    def __delitem__(self, tile_loc):
+        loc = self.ploc(tile_loc)
+        self.set_cell(loc, sentinel if self.shared_default() is not sentinel else self.make_tile(loc))
+        self.touch(loc)
+
+    def rows(self):
+        xrng, getloc = range(self.width), self.getloc
+        return [ [self[getloc(x, y)] for x in xrng] for y in range(self.height) ]
+
+
+class ChunkedStackableBoard(Chunked, StackableBoard):
+    """ Stackable board with chunked sparse storage, see `Chunked`; stacks are made on first write.
+        `instance_locs()` only indexes cells with stacks, not unwritten cells with the default tile.
+    """
+    def layer_locs(self):
+        return self.written_locs()
+
+    def __getitem__(self, loc):
+        self.init_board()
+        stack = self.get_cell(loc)
+        if stack is sentinel:
+            tile = self.shared_default()
+            if tile is sentinel:
+                tile = self.items(loc)[-1]
+        else:
+            tile = stack[-1]
+        if tile is self.shared_tile:
+            tile = tile.view(loc)
+        return tile
+
+    def __setitem__(self, tile_loc, item):
+        self.init_board()
+        loc = self.ploc(tile_loc)
+        self.items(loc).append(item)
+        self.touch(loc)
+
+    def __delitem__(self, tile_loc):
+        loc = self.ploc(tile_loc)
+        del self.items(loc)[-1]
+        self.touch(loc)
+
+    def items(self, tile_loc):
+        loc   = self.ploc(tile_loc)
+        stack = self.get_cell(loc)
+        if stack is sentinel:
+            stack = [self.make_tile(loc)]
+            self.set_cell(loc, stack)
+        return stack
+
+    def rows(self):
+        default, getloc = self.shared_default(), self.getloc
+
+        def stack(loc):
+            cell = self.get_cell(loc)
+            if cell is not sentinel    : return cell
+            if default is not sentinel : return [default]
+            return self.items(loc)
+        return [ [stack(getloc(x, y)) for x in range(self.width)] for y in range(self.height) ]
+
+
 class PygameBoard(Board):
-    def __init__(self, size, tilesize=100, message_font=None, glyph_font=None, margin=50, circle=False, tile_cls=None):
-        Board.__init__(self, size, tile_cls)
+    """ Board shown in a pygame window.
+
+        Tiles and pieces are drawn on the `sfc` surface and copied to the screen a region at a time with
+        `refresh(rect)`; drawing directly on the screen is followed by `update(rect)`. Both collect dirty
+        rects that are pushed to the display in one `display.update(rects)` call, right away or, within
+        a `transaction()`, when it ends.
+
+        With `headless`, the screen is an offscreen surface (using SDL dummy video driver) and nothing is
+        pushed to a display; every push is still counted as a frame and timed, see `fps()`, and with
+        `capture` the last `capture` frames are kept in `self.captured` as raw RGB strings.
 
+        Waiting for input or for an AI move polls events at `frame_rate`, calling `animate()` each frame;
+        AI moves are computed in a background thread with `run_ai()`.
+
+        The window shows a viewport of `view` columns and rows (by default, as much of the board as fits
+        in `max_screen`) starting at the `offset` cell; only cells in the viewport are drawn. Arrow keys
+        scroll the viewport, `+` and `-` zoom in and out; see `scroll_to()` and `zoom()`.
+    """
+    _free      = None   # flat indexes of blank cells, in no particular order
+    _free_pos  = None   # flat index -> position in `_free`, or -1 if the cell is not blank
+    _tiled_adj = None   # (loc, cross) -> neighbour locations that hold a tile, see `neighbour_locs()`
+    dirty      = None   # screen rects changed since the last `flush()`
+    batch      = 0      # nesting level of `transaction()`
+    grid_sfc   = None   # cached empty grid, see `grid()`
+    grid_key   = None   # viewport and circle mode `grid_sfc` was drawn with
+    frames     = 0      # number of frames pushed to the display
+    frame_rate = 60     # frames per second of the event loop
+    captured   = None   # raw RGB frames, see `capture` init argument
+    max_screen = 1280, 960
+    scroll_keys = {K_LEFT: (-1, 0), K_RIGHT: (1, 0), K_UP: (0, -1), K_DOWN: (0, 1)}
+
+    def __init__(self, size, tilesize=100, message_font=None, glyph_font=None, margin=50, circle=False, tile_cls=None,
+                 headless=False, capture=0, view=None):
+        super(PygameBoard, self).__init__(size, tile_cls)
+        if headless and not display.get_init():
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+
+        self.headless    = headless
+        self.clock       = time.Clock()
+        self.worker      = AIWorker()
+        self.frame_times = deque(maxlen=240)    # durations of the last frames, in seconds
+        self.last_frame  = now()
+        if capture:
+            self.captured = deque(maxlen=capture)
+
+        self.dirty     = []
+        self.sprites   = SpriteCache()
+        self.none_locs = set()      # cells cleared with `make_blank()`, drawn without an outline
         font.init()
         message_font      = message_font or (None, 60)
         glyph_font        = glyph_font or (None, 70)
@@ -336,41 +1483,186 @@ class PygameBoard(Board):
         self.glyph_font   = font.Font(glyph_font[0], glyph_font[1])
         n                 = tilesize + 1
         self.margin       = margin
-        self.scr          = display.set_mode((size[0]*n + margin*2, size[1]*n + margin*2))
+        self.tilesize     = tilesize
+        self.circle       = circle
+        self.offset       = 0, 0
+        self.view         = view or self.fit_view(self.max_screen)
+        scr_size          = self.view[0]*n + margin*2, self.view[1]*n + margin*2
+        if headless:
+            display.set_mode((1, 1))    # display format for `convert()`
+            self.scr = Surface(scr_size).convert()
+        else:
+            self.scr = display.set_mode(scr_size)
         self.scr.fill(white)
         self.sfc = Surface(self.scr.get_size())
         self.sfc = self.sfc.convert()
         self.sfc.fill(white)
 
         self.scr.blit(self.sfc, (0,0))
-        self.tilesize  = tilesize
-        self.circle    = circle
-        self.tile_locs = [[ (iround(margin+x+tilesize/2) , iround(margin+y+tilesize/2))
-                              for x in range(0, size[0]*n, n)]
-                              for y in range(0, size[1]*n, n)]
-        for tile in self:
-            self.mkgui_tile(tile.loc)
-
+        self.sfc.blit(self.grid(), (0,0))
         self.scr.blit(self.sfc, (0,0))
-        display.flip()
-
-    def mkgui_tile(self, loc, only_clear=False):
-        """ Redraw the gui tile or just clear the tile.
-
-            only_clear: use to clear 'unmovable' tiles; if False, clear and then redraw tile
+        if not headless:
+            display.flip()
+        self.frame()
+
+    def fit_view(self, screen_size):
+        """Columns and rows of the board that fit in `screen_size` pixels at the current tile size."""
+        n, m = self.tilesize + 1, self.margin
+        return ( max(1, min(self.width, (screen_size[0] - m*2) // n)),
+                 max(1, min(self.height, (screen_size[1] - m*2) // n)) )
+
+    def visible(self):
+        """Range of visible cells: x, y of the first one and x, y past the last one."""
+        (x, y), (w, h) = self.offset, self.view
+        return x, y, min(x + w, self.width), min(y + h, self.height)
+
+    def visible_locs(self):
+        """Generate locations of visible cells, row by row."""
+        x0, y0, x1, y1 = self.visible()
+        getloc = self.getloc
+        for y in range(y0, y1):
+            for x in range(x0, x1):
+                yield getloc(x, y)
+
+    def is_visible(self, loc):
+        x0, y0, x1, y1 = self.visible()
+        return x0 <= loc.x < x1 and y0 <= loc.y < y1
+
+    def scroll(self, dx, dy):
+        """Scroll the viewport by `dx`, `dy` cells."""
+        self.scroll_to(self.offset[0] + dx, self.offset[1] + dy)
+
+    def clamp_offset(self, x, y):
+        return max(0, min(x, self.width - self.view[0])), max(0, min(y, self.height - self.view[1]))
+
+    def scroll_to(self, x, y):
+        """Scroll the viewport so that `x`, `y` cell is the top left visible cell, as far as the board allows."""
+        offset = self.clamp_offset(x, y)
+        if offset != self.offset:
+            self.offset = offset
+            self.redraw()
+
+    def zoom(self, tilesize):
+        """Change tile size, fitting as many columns and rows in the window as the new size allows."""
+        tilesize = max(8, tilesize)
+        if tilesize != self.tilesize:
+            self.tilesize = tilesize
+            self.view     = self.fit_view(self.scr.get_size())
+            self.offset   = self.clamp_offset(*self.offset)
+            self.redraw()
+
+    def redraw(self):
+        """Redraw the viewport: the grid and then the contents of visible cells, see `draw_tile()`."""
+        with self.transaction():
+            self.sfc.blit(self.grid(), (0,0))
+            self.refresh(self.sfc.get_rect())
+            if self.board_initialized:      # otherwise all cells have default tiles
+                for loc in self.visible_locs():
+                    self.draw_tile(loc)
+
+    def draw_tile(self, loc):
+        """Draw contents of the cell at `loc`: tile's piece and highlight; override to draw other contents."""
+        tile  = self[loc]
+        piece = getattr(tile, "piece", None)
+        if piece is not None and hasattr(piece, "draw"):
+            piece.draw()
+        if getattr(tile, "highlight", False):
+            self.draw_highlight(loc)
+
+    def grid(self):
+        """ Surface with the empty grid of the viewport, drawn once and then used to clear tiles; it's
+            redrawn if the viewport, tile size or circle mode changes, and updated for cells added to
+            `none_locs`.
         """
+        key = self.tilesize, self.circle, self.offset, self.view
+        if self.grid_key != key:
+            self.grid_key = key
+            self.grid_sfc = Surface(self.sfc.get_size()).convert()
+            self.grid_sfc.fill(white)
+            for loc in self.visible_locs():
+                self.draw_cell(self.grid_sfc, loc, outline=loc not in self.none_locs)
+        return self.grid_sfc
+
+    def draw_cell(self, sfc, loc, outline=True):
+        """Draw empty cell at `loc` on `sfc`, with or without its outline; return the cell rect."""
         loc = self.resolve_loc(loc)
         ts = self.tilesize
+        r  = center_square(loc, ts)
         if self.circle:
-            gfxdraw.filled_circle(self.sfc, loc[0], loc[1], iround(ts/2), white)
-            if not only_clear:
-                gfxdraw.aacircle(self.sfc, loc[0], loc[1], iround(ts/2-4), gray)
+            gfxdraw.filled_circle(sfc, loc[0], loc[1], iround(ts/2), white)
+            if outline:
+                gfxdraw.aacircle(sfc, loc[0], loc[1], iround(ts/2-4), gray)
+            r = r.inflate(2, 2)     # filled circle of radius ts/2 is ts+1 pixels wide
         else:
-            r = center_square(loc, ts)
-            draw.rect(self.sfc, white, r, 0)
-            if not only_clear:
-                gfxdraw.rectangle(self.sfc, r, gray)
-        self.scr.blit(self.sfc, (0,0))
+            draw.rect(sfc, white, r, 0)
+            if outline:
+                gfxdraw.rectangle(sfc, r, gray)
+        return r
+
+    def tile_rect(self, loc):
+        """Screen rect of the cell at `loc`."""
+        r = center_square(self.resolve_loc(loc), self.tilesize)
+        return r.inflate(2, 2) if self.circle else r
+
+    def mkgui_tile(self, loc, only_clear=False):
+        """ Redraw the gui tile or just clear the tile, by copying the cell from the cached grid.
+
+            only_clear: use to clear 'unmovable' tiles; if False, clear and then redraw tile
+        """
+        none = loc in self.none_locs
+        if only_clear != none:
+            # none-tile set changed: update the cell in the cached grid
+            if only_clear : self.none_locs.add(loc)
+            else          : self.none_locs.discard(loc)
+            if self.grid_key == (self.tilesize, self.circle, self.offset, self.view) and self.is_visible(loc):
+                self.draw_cell(self.grid_sfc, loc, outline=not only_clear)
+
+        if not self.is_visible(loc):
+            return
+        r = self.tile_rect(loc)
+        self.sfc.blit(self.grid(), r, r)
+        self.refresh(r)
+
+    def refresh(self, rect):
+        """Copy `rect` region of `sfc` to the screen and mark it dirty."""
+        self.dirty.append(self.scr.blit(self.sfc, rect, rect))
+
+    def update(self, rect):
+        """Mark `rect` region of the screen dirty and push it to the display unless in a transaction."""
+        self.dirty.append(rect)
+        self.flush()
+
+    def flush(self):
+        """Push dirty rects to the display in one update, unless in a transaction."""
+        if self.dirty and not self.batch:
+            if not self.headless:
+                display.update(self.dirty)
+            self.dirty = []
+            self.frame()
+
+    def frame(self):
+        """Count and time a frame pushed to the display, capturing it if enabled."""
+        t = now()
+        self.frame_times.append(t - self.last_frame)
+        self.last_frame = t
+        self.frames    += 1
+        if self.captured is not None:
+            self.captured.append(image.tostring(self.scr, "RGB"))
+
+    def fps(self):
+        """Frames per second over the last frames."""
+        total = sum(self.frame_times)
+        return len(self.frame_times) / total if total else 0.0
+
+    @contextmanager
+    def transaction(self):
+        """Collect all drawing in the block and push it to the display in one update at the end."""
+        self.batch += 1
+        try:
+            yield
+        finally:
+            self.batch -= 1
+            self.flush()
 
     def test_unicode(self):
         t = u"""
@@ -380,11 +1672,11 @@ class PygameBoard(Board):
         self.message(t[2], (300,200))
 
     def __contains__(self, loc):
-        return loc.y < len(self.tile_locs) and loc.x < len(self.tile_locs[0])
+        return 0 <= loc.x < self.width and 0 <= loc.y < self.height
 
-    def __setitem__(self, loc, tile):
+    def __setitem__(self, loc, piece):
         if isinstance(loc, tuple):
-            loc = Loc(loc[0], loc[1])
+            loc = self.getloc(*loc)
         super(PygameBoard, self).__setitem__(loc, piece)
         if 0:
             if isinstance(piece, (str, unicode)):
@@ -393,93 +1685,235 @@ class PygameBoard(Board):
                 piece.draw()
             display.update()
 
+    def neighbour_locs(self, tile_loc):
+        """Return the tuple of neighbour locations of `tile`, skipping cells without a tile."""
+        return self.tiled_adjacent(self.ploc(tile_loc), False)
+
+    def neighbour_cross_locs(self, tile_loc):
+        """Return the tuple of 'cross' neighbour locations of `tile`, skipping cells without a tile."""
+        return self.tiled_adjacent(self.ploc(tile_loc), True)
+
+    def tiled_adjacent(self, loc, cross):
+        """ Neighbour locations of `loc` that hold a tile, cached until a write to one of the neighbours
+            (see `touch()`).
+        """
+        self.init_board()
+        key  = loc, cross
+        locs = self._tiled_adj.get(key)
+        if locs is None:
+            base = super(PygameBoard, self)
+            base = base.neighbour_cross_locs(loc) if cross else base.neighbour_locs(loc)
+            locs = self._tiled_adj[key] = tuple(l for l in base if self[l] is not None)
+        return locs
+
     def move(self, loc1, loc2):
-        piece = self[loc1].piece
-        self[loc1].piece = None
-        self[loc2].piece = piece
-        self[loc2].highlight = False
-        piece.loc = loc2
-        self.clear(loc1)
-        piece.draw()
+        with self.transaction():
+            piece = self[loc1].piece
+            self[loc1].piece = None
+            self[loc2].piece = piece
+            self[loc2].highlight = False
+            piece.loc = loc2
+            self.touch(loc1)
+            self.touch(loc2)
+            self.clear(loc1)
+            piece.draw()
+
+    def reindex(self):
+        super(PygameBoard, self).reindex()
+        self._free = self._free_pos = None     # rebuilt on the first `random_blank()` / `filled()`
+        self._tiled_adj = {}
+
+    def tracks_writes(self):
+        return super(PygameBoard, self).tracks_writes() or self._free_pos is not None or bool(self._tiled_adj)
+
+    def touch(self, loc):
+        """Update the attribute index, cached neighbours and the pool of blank cells after a write to `loc`."""
+        super(PygameBoard, self).touch(loc)
+        tiled_adj = self._tiled_adj
+        if tiled_adj:
+            for l in super(PygameBoard, self).neighbour_locs(loc):
+                tiled_adj.pop((l, False), None)
+                tiled_adj.pop((l, True), None)
+
+        free, free_pos = self._free, self._free_pos
+        if free_pos is None:
+            return
+
+        i   = loc.y*self.width + loc.x
+        pos = free_pos[i]
+        if self.is_blank(self[loc]):
+            if pos < 0:
+                free_pos[i] = len(free)
+                free.append(i)
+        elif pos >= 0:
+            # swap-remove: move the last free cell into the vacated position
+            last = free.pop()
+            if last != i:
+                free[pos]      = last
+                free_pos[last] = pos
+            free_pos[i] = -1
+
+    def init_free(self):
+        """Build the pool of blank cells, used by `random_blank()` and `filled()`."""
+        is_blank       = self.is_blank
+        cells          = (tile for row in self.rows() for tile in row)
+        self._free     = [i for i, tile in enumerate(cells) if tile is None or is_blank(tile)]
+        self._free_pos = [-1] * (self.width * self.height)
+        for pos, i in enumerate(self._free):
+            self._free_pos[i] = pos
+
+    def is_blank(self, tile):
+        """A cell is blank if it has no tile at all or if its tile has a true `blank` attribute."""
+        return tile is None or bool(getattr(tile, "blank", False))
 
     def is_highlighted(self, loc):
         return self[loc].highlight
 
     def resolve_loc(self, loc):
-        """Return exact pixel center location from tile index `loc`."""
-        return self.tile_locs[loc.y][loc.x]
+        """Return exact pixel center location from tile index `loc`, relative to the viewport."""
+        n, m, ts = self.tilesize + 1, self.margin, self.tilesize
+        return iround(m + (loc.x - self.offset[0])*n + ts/2), iround(m + (loc.y - self.offset[1])*n + ts/2)
+
+    def click_loc(self, pos):
+        """Location of the visible cell at `pos` pixel, or None."""
+        n, m = self.tilesize + 1, self.margin
+        x, y = (pos[0] - m) // n, (pos[1] - m) // n
+        if 0 <= x < self.view[0] and 0 <= y < self.view[1]:
+            return self.getloc(x + self.offset[0], y + self.offset[1])
+
+    def highlight_rect(self, loc):
+        return center_square(self.resolve_loc(loc), self.tilesize - 6)
+
+    def draw_highlight(self, loc):
+        """Draw highlight frame on the screen (highlights are not drawn on `sfc`)."""
+        r = self.highlight_rect(loc)
+        draw.rect(self.scr, light_blue, r, 3)
+        self.update(r)
 
     def toggle_highlight(self, loc):
         if self[loc]:
-            color     = white if self[loc].highlight else light_blue
-            thickness = 3
-            th2       = thickness*2
-
-            r = center_square(self.resolve_loc(loc), self.tilesize-th2)
-            draw.rect(self.scr, color, r, thickness)
+            if self.is_visible(loc):
+                if self[loc].highlight:
+                    # `sfc` has the tile without the highlight
+                    self.refresh(self.highlight_rect(loc))
+                    self.flush()
+                else:
+                    self.draw_highlight(loc)
             self[loc].highlight = not self[loc].highlight
-            display.update()
+            self.touch(loc)
 
     def clear(self, loc):
         self.mkgui_tile(loc)
-        display.update()
+        self.flush()
 
     def make_blank(self, loc):
         self.mkgui_tile(loc, only_clear=True)
-        display.update()
+        self.flush()
+
+    def tick(self):
+        """End a frame of the event loop: animate, push drawing to the display and wait for the next frame."""
+        self.animate()
+        self.flush()
+        self.clock.tick(self.frame_rate)
+
+    def animate(self):
+        """Called once per frame of the event loop; override to update animations."""
+        pass
+
+    def poll(self):
+        """Return pending events, without waiting; exit on quit or escape."""
+        events = event.get()
+        for ev in events:
+            if ev.type == QUIT or ev.type == KEYDOWN and ev.key == K_ESCAPE:
+                self.worker.cancel()
+                sys.exit()
+            elif ev.type == KEYDOWN and ev.key in self.scroll_keys:
+                self.scroll(*self.scroll_keys[ev.key])
+            elif ev.type == KEYDOWN and ev.unicode in ("+", "-"):
+                self.zoom(self.tilesize + (4 if ev.unicode == "+" else -4))
+        return events
 
     def wait_exit(self):
         while True:
-            ev = event.wait()
-            if ev.type == QUIT or ev.type == MOUSEBUTTONDOWN or ev.type == KEYDOWN:
-                sys.exit()
+            for ev in self.poll():
+                if ev.type == MOUSEBUTTONDOWN or ev.type == KEYDOWN:
+                    sys.exit()
+            self.tick()
 
     def get_click_index(self):
         """Get location of clicked tile."""
         while True:
-            ev = event.wait()
-            if ev.type == QUIT:
-                sys.exit(); pygame.quit()
-            if ev.type == KEYDOWN and ev.key == K_ESCAPE:
-                sys.exit(); pygame.quit()
-            if ev.type == MOUSEBUTTONDOWN:
-                n = self.tilesize + 1
-                m = self.margin
-                loc = Loc(int((ev.pos[0]-m) / n), int((ev.pos[1]-m) / n))
-                if loc in self:
-                    return loc
+            for ev in self.poll():
+                if ev.type == MOUSEBUTTONDOWN:
+                    loc = self.click_loc(ev.pos)
+                    if loc:
+                        return loc
+            self.tick()
+
+    def run_ai(self, func, *args, **kwargs):
+        """ Run `func(*args, cancel=<threading.Event>, **kwargs)` in the background worker, keeping the
+            event loop running, and return its result; with `budget` keyword argument, `cancel` is set
+            after `budget` seconds. Input events that arrive in the meantime are dropped.
+        """
+        budget = kwargs.pop("budget", None)
+        token  = self.worker.start(func, *args, **kwargs)
+        start  = now()
+        while True:
+            for ev in self.poll():
+                if ev.type == AI_DONE and ev.token == token:
+                    if ev.error:
+                        raise ev.error
+                    return ev.result
+            if budget is not None and now() - start > budget:
+                self.worker.cancel()
+            self.tick()
+
+    def sprite(self, key, render):
+        """ Surface rendered by `render()`, cached in `self.sprites` under `key` and the tile size;
+            `render` should return a surface converted to the display format.
+        """
+        return self.sprites.get(key + (self.tilesize,), render)
 
     def draw_glyph(self, char, center, color=(0,0,0), bgcolor=(255,255,255)):
         """Draw glyph `char` at `loc`."""
-        char = self.glyph_font.render(unicode(char), 1, color, bgcolor)
-        rect = char.get_rect()
+        render = lambda: self.glyph_font.render(unicode(char), 1, color, bgcolor).convert()
+        char   = self.sprite(("glyph", char, color, bgcolor), render)
+        rect   = char.get_rect()
         rect.center = center
-        display.update(self.scr.blit(char, rect))
+        self.update(self.scr.blit(char, rect))
 
     def message(self, txt, center=None, color=None, bgcolor=None, border=None, border_size=4, board_center=True):
         """Display message on screen."""
         color   = color or (0,0,0)
         bgcolor = bgcolor or (235,235,235)
         border  = border or (100,100,100)
-        txt     = self.message_font.render(txt, 1, color, bgcolor)
+        render  = lambda: self.message_font.render(txt, 1, color, bgcolor).convert()
+        txt     = self.sprite(("message", txt, color, bgcolor), render)
         rect    = txt.get_rect()
 
         if board_center and not center:
-            i = display.Info()
-            center = i.current_w / 2, i.current_h / 2
+            w, h   = self.scr.get_size()
+            center = w / 2, h / 2
         rect.center = center
 
         border_size += 8
-        draw.rect(self.scr, bgcolor, rect.inflate(border_size, border_size))
-        # print("rect", rect)
-        draw.rect(self.scr, border, rect.inflate(border_size, border_size))
-        # print("rect", rect)
-        display.update()
-        display.update(self.scr.blit(txt, rect))
+        box = rect.inflate(border_size, border_size)
+        draw.rect(self.scr, bgcolor, box)
+        draw.rect(self.scr, border, box)
+        self.scr.blit(txt, rect)
+        self.update(box)
 
     def filled(self):
-        return not any(tile is None for tile in self)
+        """No blank cells left on the board."""
+        self.init_board()
+        if self._free_pos is None:
+            self.init_free()
+        return not self._free
 
     def random_blank(self):
-        locs = [loc for loc in self.locations() if self[loc] and not self[loc].piece and not self[loc].none]
-        return randchoice(locs) if locs else None
+        self.init_board()
+        if self._free_pos is None:
+            self.init_free()
+        if self._free:
+            i = randchoice(self._free)
+            return self.getloc(i % self.width, i // self.width)
@@ -17,18 +17,31 @@ class BaseTile(object):
 class Loc(object):
     """ Location on game board; note that we should not modify the location in place to avoid many
         hard to track errors; `moved()` creates and returns a new instance.
+
+        Boards hand out interned locations (see `BaseBoard.getloc()`), so there is a single
+        instance per board coordinate and most comparisons are identity checks.
     """
+    __slots__ = ("x", "y")
+
     def __init__(self, x, y):
-        self.loc = x, y
         self.x, self.y = x, y
 
+    @property
+    def loc(self):
+        return self.x, self.y
+
     def __repr__(self):
         return str(self.loc)
 
     def __iter__(self):
-        return iter(self.loc)
+        yield self.x
+        yield self.y
 
     def __eq__(self, other):
+        if other is self:
+            return True
+        if isinstance(other, Loc):
+            return self.x == other.x and self.y == other.y
         return self.loc == getattr(other, "loc", None)
 
     def __ne__(self, other):
@@ -45,6 +58,9 @@ class Loc(object):
 
 Dir = Loc   # Directions (e.g. 0,1=right) work the same way but should have a different name for clarity
 
+_loc_tables       = {}  # interned locations, shared by all boards of the same size
+_adjacency_tables = {}  # per-cell tuples of neighbour locations, keyed by board size and neighbourhood
+
 class BaseBoard(object):
     """ Base Board for regular and stackable boards.
 
@@ -67,10 +83,58 @@ class BaseBoard(object):
         self.init_tiles  = False
 
         self.tiletpl     = "%%%ds" % (padding[0] + 1)
+        self.make_locs()
         self.directions()
+        self.make_adjacency()
 
     def __iter__(self):
-        return ( self[Loc(x, y)] for y in range(self.height) for x in range(self.width) )
+        return ( self[loc] for loc in self.iterlocs() )
+
+    def make_locs(self):
+        """Set up the table of interned locations; boards of the same size share one table."""
+        size = self.width, self.height
+        if size not in _loc_tables:
+            _loc_tables[size] = [None] * (self.width * self.height)
+        self._locs = _loc_tables[size]
+
+    def make_adjacency(self):
+        """ Set up 8-way and 4-way ('cross') adjacency tables; like locations, they are shared between
+            boards of the same size and each cell's entry is filled in on first lookup.
+        """
+        n = self.width * self.height
+        for key, attr in ((8, "_adj8"), (4, "_adj4")):
+            key = self.width, self.height, key
+            if key not in _adjacency_tables:
+                _adjacency_tables[key] = [None] * n
+            setattr(self, attr, _adjacency_tables[key])
+
+    def adjacent(self, loc, table, dirs):
+        """Return tuple of valid locations next to `loc` in `dirs` directions, cached in `table`."""
+        i    = loc.y*self.width + loc.x
+        locs = table[i]
+        if locs is None:
+            x, y   = loc.x, loc.y
+            getloc = self.getloc
+            locs   = table[i] = tuple(l for l in (getloc(x + d.x, y + d.y) for d in dirs) if l)
+        return locs
+
+    def getloc(self, x, y):
+        """Return the interned location at `x`, `y`, or None if it's outside of the board."""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            i   = y*self.width + x
+            loc = self._locs[i]
+            if loc is None:
+                loc = self._locs[i] = Loc(x, y)
+            return loc
+
+    def iterlocs(self):
+        """Generate all interned locations, row by row."""
+        w, locs = self.width, self._locs
+        for i in range(w * self.height):
+            loc = locs[i]
+            if loc is None:
+                loc = locs[i] = Loc(i % w, i // w)
+            yield loc
 
     def tiles(self, *attrs):
         return [ t for t in self if all(getattr(t, attr) for attr in attrs) ]
@@ -79,12 +143,10 @@ class BaseBoard(object):
         return [ t for t in self if all(not getattr(t, attr) for attr in attrs) ]
 
     def locations(self, *attrs):
-        locs = (Loc(x, y) for y in range(self.height) for x in range(self.width))
-        return [ l for l in locs if all(getattr(self[l], attr) for attr in attrs) ]
+        return [ l for l in self.iterlocs() if all(getattr(self[l], attr) for attr in attrs) ]
 
     def locations_not(self, *attrs):
-        locs = (Loc(x, y) for y in range(self.height) for x in range(self.width))
-        return [ l for l in locs if all(not getattr(self[l], attr) for attr in attrs) ]
+        return [ l for l in self.iterlocs() if all(not getattr(self[l], attr) for attr in attrs) ]
 
     def ploc(self, tile_loc):
         """Parse location out of tile-or-loc `tile_loc`."""
@@ -122,21 +184,16 @@ class BaseBoard(object):
         self.dirnames = dict(zip(self.dirlist2, "up ru right rd down ld left lu".split()))
 
     def neighbour_locs(self, tile_loc):
-        """Return the list of neighbour locations of `tile`."""
-        x, y = self.ploc(tile_loc)
-        coords = (-1,0,1)
-        locs = set((x+n, y+m) for n in coords for m in coords) - set( [(x,y)] )
-        return [ Loc(*tpl) for tpl in locs if self.valid(Loc(*tpl)) ]
+        """Return the tuple of neighbour locations of `tile`."""
+        return self.adjacent(self.ploc(tile_loc), self._adj8, self.dirlist2)
 
     def neighbours(self, tile_loc):
         """Return the list of neighbours of `tile`."""
         return [self[loc] for loc in self.neighbour_locs(tile_loc)]
 
     def neighbour_cross_locs(self, tile_loc):
-        """Return a generator of neighbour 'cross' (i.e. no diagonal) locations of `tile`."""
-        x, y = self.ploc(tile_loc)
-        locs = ((x-1, y), (x+1, y), (x, y-1), (x, y+1))
-        return [ Loc(*tpl) for tpl in locs if self.valid(Loc(*tpl)) ]
+        """Return the tuple of neighbour 'cross' (i.e. no diagonal) locations of `tile`."""
+        return self.adjacent(self.ploc(tile_loc), self._adj4, self.dirlist)
 
     def cross_neighbours(self, tile_loc):
         """Return the generator of 'cross' (i.e. no diagonal) neighbours of `tile`."""
@@ -164,15 +221,8 @@ class BaseBoard(object):
         y   = loc.y + dir.y*n
 
         if wrap:
-            while not self.valid(Loc(x,y)):
-                if x > (self.width - 1)  : x -= self.width
-                elif x < 0               : x += self.width
-
-                if y > (self.height - 1) : y -= self.height
-                elif y < 0               : y += self.height
-
-        loc = Loc(x, y)
-        return loc if self.valid(loc) else None
+            x, y = x % self.width, y % self.height
+        return self.getloc(x, y)
 
     def next_tile(self, tile_loc, dir, n=1):
         loc = self.nextloc(tile_loc, dir, n)
@@ -237,7 +287,8 @@ class Board(BaseBoard):
         if not self.board_initialized:
             self.board_initialized = True
             xrng, yrng = range(self.width), range(self.height)
-            self.board = [ [self.make_tile(Loc(x, y)) for x in xrng] for y in yrng ]
+            getloc     = self.getloc
+            self.board = [ [self.make_tile(getloc(x, y)) for x in xrng] for y in yrng ]
 
 
 class StackableBoard(BaseBoard):
@@ -273,7 +324,8 @@ class StackableBoard(BaseBoard):
         if not self.board_initialized:
             self.board_initialized = True
             xrng, yrng = range(self.width), range(self.height)
-            self.board = [ [ [self.make_tile( Loc(x, y) )] for x in xrng] for y in yrng ]
+            getloc     = self.getloc
+            self.board = [ [ [self.make_tile( getloc(x, y) )] for x in xrng] for y in yrng ]
 
     def items(self, tile_loc):
         loc = self.ploc(tile_loc)
@@ -6,7 +6,8 @@ from itertools import cycle
 from pygame import *
 from pygame import gfxdraw
 
-from board import PygameBoard, Loc, black, white, gray, center_square
+from board import PygameBoard, FlyweightTile, Loc, black, white, gray, center_square
+from pathfinding import downhill
 from utils import *
 
 """
@@ -29,7 +30,7 @@ class Player(object):
     def __repr__(self):
         return self.id
 
-class BaseTile(object):
+class BaseTile(FlyweightTile):
     highlight = False
     piece     = None
 
@@ -41,6 +42,7 @@ class BaseTile(object):
     def set_none(self):
         self.none = True
         if self.board:
+            self.board.touch(self.loc)
             self.board.make_blank(self.loc)
 
     @property
@@ -62,36 +64,47 @@ class BasePiece(object):
         return self.player
 
     def draw(self):
-        """Draw piece."""
-        getattr(self, "draw_"+self.id)(self.loc)
-        display.update()
+        """Draw piece, using a sprite rendered on first use."""
+        B      = self.board
+        if not B.is_visible(self.loc):
+            return
+        sprite = B.sprite(("piece", self.id), self.render)
+        rect   = sprite.get_rect(center=B.resolve_loc(self.loc))
+        B.sfc.blit(sprite, rect)
+        B.refresh(rect)
+        B.flush()
+
+    def render(self):
+        """Render piece on a transparent tile-sized surface."""
+        ts  = self.board.tilesize
+        sfc = Surface((ts, ts), SRCALPHA).convert_alpha()
+        getattr(self, "draw_"+self.id)(sfc, (ts//2, ts//2))
+        return sfc
 
     def move(self, loc):
         self.board.move(self.loc, loc)
 
     def place(self):
         self.board[self.loc].piece = self
+        self.board.touch(self.loc)
         self.draw()
 
 
 class Piece(BasePiece):
-    def draw_r(self, loc):
-        B = self.board
-        r = center_square(B.resolve_loc(loc), iround(B.tilesize*0.5))
-        draw.rect(B.sfc, (50,50,50), r, 1)
-        draw.rect(B.sfc, gray, r.inflate(-4,-4), 0)
-        B.scr.blit(B.sfc, (0,0))
-
-    def draw_o(self, loc):
-        B = self.board
-        loc = B.resolve_loc(loc)
-        rad = iround((B.tilesize/2) * 0.6)
-        gfxdraw.filled_circle(B.sfc, loc[0], loc[1], rad, (120,120,120))
-        gfxdraw.aacircle(B.sfc, loc[0], loc[1], rad + 2, black)
-        B.scr.blit(B.sfc, (0,0))
+    def draw_r(self, sfc, center):
+        r = center_square(center, iround(self.board.tilesize*0.5))
+        draw.rect(sfc, (50,50,50), r, 1)
+        draw.rect(sfc, gray, r.inflate(-4,-4), 0)
+
+    def draw_o(self, sfc, center):
+        rad = iround((self.board.tilesize/2) * 0.6)
+        gfxdraw.filled_circle(sfc, center[0], center[1], rad, (120,120,120))
+        gfxdraw.aacircle(sfc, center[0], center[1], rad + 2, black)
 
 
 class GameBoard(PygameBoard):
+    flyweight = True
+
     def move(self, loc1, loc2):
         p1 = self[loc1].piece
         p2 = self[loc2].piece
@@ -101,8 +114,9 @@ class GameBoard(PygameBoard):
             ai_pieces.remove(p2)
         elif p2 in player_pieces:
             player_pieces.remove(p2)
-        self.clear(loc2)
-        super(GameBoard, self).move(loc1, loc2)
+        with self.transaction():
+            self.clear(loc2)
+            super(GameBoard, self).move(loc1, loc2)
 
 
 class Game1(object):
@@ -129,16 +143,31 @@ class Game1(object):
             self.human_move(player)
 
     def ai_move(self, player):
-        """Capture player piece if possible, otherwise move to a blank if possible, or try another piece."""
+        """Make AI move, chosen in the background worker."""
+        move = board.run_ai(self.ai_choice, player)
+        if move:
+            piece, loc = move
+            piece.move(loc)
+
+    def ai_choice(self, player, cancel=None):
+        """ Move the piece closest to a player's piece one step towards it (or capture it), otherwise
+            move to a blank if possible, or try another piece.
+        """
         shuffle(player.pieces)
+        dist  = board.distance_map([p.loc for p in player_pieces])
+        steps = [(p, downhill(board, dist, p)) for p in player.pieces]
+        steps = [(dist[loc.y, loc.x], p, loc) for p, loc in steps if loc]
+        if steps:
+            _, p, loc = min(steps, key=lambda s: s[0])
+            return p, loc
+
         for p in player.pieces:
             nbrs   = board.neighbour_locs(p)
             pl     = [loc for loc in nbrs if same_side(board[loc].piece, p1)]
             blanks = [loc for loc in nbrs if board[loc].blank]
             loc    = first(pl) or randchoice(blanks) if blanks else None
             if loc:
-                p.move(loc)
-                break
+                return p, loc
 
     def human_move(self, player):
         """ Select a piece and then move a highlighted piece.
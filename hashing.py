@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals, division
+from random import Random
+
+
+def symmetries(width, height):
+    """ Cell index permutations (cell index being `x + y*width`) for rotations and reflections of a
+        `width` x `height` board: 8 for a square board, 4 for a rectangular one; the first one is identity.
+    """
+    w, h = width, height
+    transforms = [
+        lambda x, y: (x, y),
+        lambda x, y: (w-1-x, y),
+        lambda x, y: (x, h-1-y),
+        lambda x, y: (w-1-x, h-1-y),
+        lambda x, y: (y, x),
+        lambda x, y: (h-1-y, x),
+        lambda x, y: (y, w-1-x),
+        lambda x, y: (h-1-y, w-1-x),
+    ]
+    cells = [(i % w, i // w) for i in range(w*h)]
+    return [ [tx + ty*w for tx, ty in (t(x, y) for x, y in cells)]
+             for t in transforms[:8 if w == h else 4] ]
+
+
+def inverse(perm):
+    inv = [0] * len(perm)
+    for i, j in enumerate(perm):
+        inv[j] = i
+    return inv
+
+
+class Zobrist(object):
+    """ Random 64-bit keys for each (cell, tile value) pair; the key of a position is the XOR of keys of
+        all of its cells, so it can be updated incrementally as cells change. Keys are made on first use of
+        each pair, so boards with many distinct tile values only store keys of pairs that occur; a key is
+        drawn from a generator seeded by `seed` and the pair, so it doesn't depend on the order pairs are
+        first seen in.
+    """
+    def __init__(self, ncells, seed=None):
+        self.ncells = ncells
+        self.salt   = Random(seed).getrandbits(64)
+        self.keys   = {}        # (cell index, tile value) -> key
+
+    def __call__(self, i, value):
+        """Key of `value` at cell index `i`."""
+        key = self.keys.get((i, value))
+        if key is None:
+            key = self.keys[i, value] = Random(hash((self.salt, i, value))).getrandbits(64)
+        return key
+
+
+class TranspositionTable(object):
+    """ Fixed-size table of search results keyed by integer position keys.
+
+        With the "depth" policy each bucket has two slots: a depth-preferred slot that is only replaced
+        by results of at least the same depth, and an always-replace slot for the rest; the "always"
+        policy keeps a single, always replaced slot.
+    """
+    def __init__(self, size=2**17, policy="depth"):
+        assert policy in ("depth", "always")
+        self.size   = size
+        self.policy = policy
+        self.deep   = [None] * size
+        self.recent = [None] * size if policy == "depth" else self.deep
+        self.hits   = self.misses = 0
+
+    def __len__(self):
+        slots = (self.deep, self.recent) if self.recent is not self.deep else (self.deep,)
+        return sum(1 for slot in slots for entry in slot if entry is not None)
+
+    def get(self, key, default=None):
+        """Return (depth, *data) stored for `key` or `default`."""
+        i     = key % self.size
+        entry = self.deep[i]
+        if entry is None or entry[0] != key:
+            entry = self.recent[i]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1:]
+        self.misses += 1
+        return default
+
+    def put(self, key, depth, *data):
+        """Store `data` for `key`, searched to `depth`."""
+        i     = key % self.size
+        entry = (key, depth) + data
+        old   = self.deep[i]
+        if self.policy == "always" or old is None or old[0] == key or depth >= old[1]:
+            self.deep[i] = entry
+            if old is not None and old[0] != key and self.recent is not self.deep:
+                self.recent[i] = old
+        else:
+            self.recent[i] = entry
+
+    def clear(self):
+        self.deep[:] = [None] * self.size
+        if self.recent is not self.deep:
+            self.recent[:] = [None] * self.size
+        self.hits = self.misses = 0
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals, division
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# window directions: right, down, right-down, left-down
+window_dirs = ((1, 0), (0, 1), (1, 1), (-1, 1))
+
+
+class WindowCounts(object):
+    """ Number of each player's marks in every `k`-long window along rows, columns and both diagonals
+        of a `width` x `height` board, for k-in-a-row games (e.g. gomoku: 5 in a row on 19x19).
+
+        Windows are not enumerated: for each direction there is a 2D array of counts indexed by the
+        window's starting cell. Counts are built with vectorized sliding-window sums and then updated
+        by `add()` for just the windows through the changed cell.
+    """
+    def __init__(self, width, height, k):
+        if np is None:
+            raise ImportError("WindowCounts requires numpy")
+        self.width, self.height, self.k = width, height, k
+
+        self.occupied = np.zeros((height, width), dtype=np.int8)
+        self.planes   = {}      # player -> plane of player's marks
+        self.counts   = {}      # player -> list of count arrays, one per direction
+        self.total    = [self.make_counts(d) for d in window_dirs]      # counts of all players' marks
+        self.full     = {}      # player -> number of completed windows
+        self.weights  = np.array([0] + [4**n for n in range(k)], dtype=np.int64)
+
+        i = np.arange(k)
+        self.offsets = [(d, i*d[0], i*d[1]) + self.origin(d) for d in window_dirs]
+
+    def origin(self, dir):
+        """Starting cell of the first window in `dir` direction."""
+        return (self.k-1 if dir[0] < 0 else 0), 0
+
+    def make_counts(self, dir):
+        """Zero counts array for windows in `dir` direction."""
+        dx, dy = dir
+        w = self.width - (self.k-1 if dx else 0)
+        h = self.height - (self.k-1 if dy else 0)
+        return np.zeros((max(h, 0), max(w, 0)), dtype=np.int16)
+
+    def window_sums(self, plane, dir):
+        """Sliding-window sums of `plane` in `dir` direction."""
+        counts = self.make_counts(dir)
+        h, w   = counts.shape
+        x0, y0 = self.origin(dir)
+        for n in range(self.k):
+            x, y = x0 + n*dir[0], y0 + n*dir[1]
+            counts += plane[y:y+h, x:x+w]
+        return counts
+
+    def add_player(self, player):
+        if player not in self.planes:
+            self.planes[player] = np.zeros((self.height, self.width), dtype=np.int8)
+            self.counts[player] = [self.make_counts(d) for d in window_dirs]
+            self.full[player]   = 0
+
+    def load(self, marks):
+        """Rebuild all counts from `marks`, a dict of player -> boolean plane of player's marks."""
+        self.occupied[:] = 0
+        self.planes, self.counts, self.full = {}, {}, {}
+        for player, plane in marks.items():
+            self.add_player(player)
+            self.planes[player][:] = plane
+            self.occupied         += self.planes[player]
+
+        for n, d in enumerate(window_dirs):
+            self.total[n][:] = 0
+            for player, plane in self.planes.items():
+                counts                = self.counts[player][n]
+                counts[:]             = self.window_sums(plane, d)
+                self.total[n]        += counts
+                self.full[player]    += int((counts == self.k).sum())
+
+    def add(self, x, y, player, delta=1):
+        """Add (or with `delta=-1`, remove) `player`'s mark at `x`, `y`; return True if it completes a window."""
+        self.add_player(player)
+        self.planes[player][y, x] += delta
+        self.occupied[y, x]       += delta
+        k, won = self.k, False
+
+        for n, (d, ix, iy, x0, y0) in enumerate(self.offsets):
+            counts = self.counts[player][n]
+            h, w   = counts.shape
+            sx, sy = x - ix - x0, y - iy - y0
+            valid  = (sx >= 0) & (sx < w) & (sy >= 0) & (sy < h)
+            if not valid.any():
+                continue
+            sx, sy = sx[valid], sy[valid]
+
+            if delta < 0:
+                self.full[player] -= int((counts[sy, sx] == k).sum())
+            counts[sy, sx]        += delta
+            self.total[n][sy, sx] += delta
+            if delta > 0:
+                full = int((counts[sy, sx] == k).sum())
+                self.full[player] += full
+                won = won or bool(full)
+        return won
+
+    def won(self, player):
+        return bool(self.full.get(player))
+
+    def open_windows(self, player, n):
+        """List of per-direction boolean arrays of windows with exactly `n` marks, all of them `player`'s."""
+        if player not in self.counts:
+            return [np.zeros(c.shape, dtype=bool) for c in self.total]
+        return [(mine == n) & (total == n) for mine, total in zip(self.counts[player], self.total)]
+
+    def win_moves(self, player):
+        """List of x, y cells that complete a window for `player`."""
+        moves = set()
+        for (d, ix, iy, x0, y0), mask in zip(self.offsets, self.open_windows(player, self.k-1)):
+            starts = np.argwhere(mask)
+            if not len(starts):
+                continue
+            cx = starts[:, 1:2] + x0 + ix
+            cy = starts[:, 0:1] + y0 + iy
+            n  = np.argmin(self.occupied[cy, cx], axis=1)
+            rows = np.arange(len(starts))
+            moves.update(zip(cx[rows, n].tolist(), cy[rows, n].tolist()))
+        return sorted(moves)
+
+    def is_draw(self):
+        """Every window has marks of more than one player."""
+        if not self.counts:
+            return not any(total.size for total in self.total)
+        for n, total in enumerate(self.total):
+            live = np.zeros(total.shape, dtype=bool)
+            for counts in self.counts.values():
+                live |= counts[n] == total
+            if live.any():
+                return False
+        return True
+
+    def score(self, player):
+        """ Heuristic score of the position for `player`: weighted windows that only have `player`'s
+            marks, minus the same for the other players.
+        """
+        score = 0
+        for p, pcounts in self.counts.items():
+            sign = 1 if p == player else -1
+            for counts, total in zip(pcounts, self.total):
+                score += sign * int(self.weights[counts[counts == total]].sum())
+        return score
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals, division
+from heapq import heappush, heappop
+from collections import deque, OrderedDict
+from itertools import count
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def is_blank(tile):
+    """Default passability test: blank tiles can be moved through."""
+    return getattr(tile, "blank", False)
+
+
+def neighbour_locs(board, loc, cross):
+    return board.neighbour_cross_locs(loc) if cross else board.neighbour_locs(loc)
+
+
+def astar(board, start, goal, passable=None, cross=False, cost=None):
+    """ Shortest path from `start` to `goal` (tiles or locations) as a list of locations, excluding
+        `start` and ending with `goal`, or None if there is no path.
+
+        Steps go to all neighbours, or with `cross` to 'cross' neighbours only; the path goes through
+        tiles `passable(tile)` is true for (by default, blank tiles), except that `goal` itself may be
+        occupied, e.g. by a piece to capture. `cost(tile)` is the cost of stepping onto a tile, 1 by default; costs below 1 make
+        the distance estimate inadmissible, so the path may not be the shortest.
+    """
+    passable = passable or is_blank
+    start, goal = board.ploc(start), board.ploc(goal)
+    start, goal = board.getloc(start.x, start.y), board.getloc(goal.x, goal.y)
+    steps    = board.topology.steps
+    estimate = lambda l: steps(l.x, l.y, goal.x, goal.y, cross)
+
+    tie   = count()     # keeps heap entries with equal priority from comparing locations
+    queue = [(estimate(start), next(tie), start)]
+    dist  = {start: 0}
+    came  = {start: None}
+    done  = set()
+
+    while queue:
+        _, _, loc = heappop(queue)
+        if loc == goal:
+            path = []
+            while loc != start:
+                path.append(loc)
+                loc = came[loc]
+            return path[::-1]
+        if loc in done:
+            continue
+        done.add(loc)
+
+        for nloc in neighbour_locs(board, loc, cross):
+            if nloc in done:
+                continue
+            tile = board[nloc]
+            if nloc != goal and not passable(tile):
+                continue
+            d = dist[loc] + (cost(tile) if cost else 1)
+            if d < dist.get(nloc, d+1):
+                dist[nloc], came[nloc] = d, loc
+                heappush(queue, (d + estimate(nloc), next(tie), nloc))
+
+
+def distance_map(board, sources, passable=None, cross=False, cost=None):
+    """ Distances from the nearest of `sources` (tiles or locations) to every cell, as a float array
+        indexed by y, x, with `inf` for cells that can't be reached; return the array and a boolean array
+        of cells the result depends on: those looked at by the search, including the sources.
+
+        See `astar()` for `passable`, `cross` and `cost`; the sources themselves don't need to be
+        passable. Unit costs are searched breadth-first, other costs with Dijkstra's algorithm.
+    """
+    if np is None:
+        raise ImportError("distance_map requires numpy")
+    passable = passable or is_blank
+    inf, w   = float("inf"), board.width
+    dist     = [inf] * (w * board.height)     # flat lists are much faster to index than arrays
+    seen     = [False] * len(dist)
+    sources  = [board.ploc(s) for s in sources]
+    sources  = [board.getloc(s.x, s.y) for s in sources]
+
+    for loc in sources:
+        i = loc.y*w + loc.x
+        dist[i], seen[i] = 0, True
+
+    if cost is None:
+        queue = deque(sources)
+        while queue:
+            loc = queue.popleft()
+            d   = dist[loc.y*w + loc.x] + 1
+            for nloc in neighbour_locs(board, loc, cross):
+                i = nloc.y*w + nloc.x
+                if seen[i]:
+                    continue
+                seen[i] = True
+                if passable(board[nloc]):
+                    dist[i] = d
+                    queue.append(nloc)
+    else:
+        tie   = count()
+        queue = [(0, next(tie), loc) for loc in sources]
+        costs = {}      # cell index -> cost of stepping onto it, None if not passable
+        while queue:
+            d, _, loc = heappop(queue)
+            if d > dist[loc.y*w + loc.x]:
+                continue
+            for nloc in neighbour_locs(board, loc, cross):
+                i = nloc.y*w + nloc.x
+                if not seen[i]:
+                    seen[i]  = True
+                    tile     = board[nloc]
+                    costs[i] = cost(tile) if passable(tile) else None
+                step = costs.get(i)
+                if step is not None and d + step < dist[i]:
+                    dist[i] = d + step
+                    heappush(queue, (d + step, next(tie), nloc))
+
+    shape = board.height, w
+    return np.array(dist).reshape(shape), np.array(seen, dtype=bool).reshape(shape)
+
+
+def downhill(board, dist, tile_loc, cross=False):
+    """ Neighbour location of `tile_loc` that is closest to the sources of distance map `dist`, or None
+        if no neighbour is closer than `tile_loc` itself; e.g. the next step of a unit chasing the
+        nearest target.
+    """
+    loc  = board.ploc(tile_loc)
+    best = dist[loc.y, loc.x]
+    step = None
+    for nloc in neighbour_locs(board, loc, cross):
+        d = dist[nloc.y, nloc.x]
+        if d < best:
+            best, step = d, nloc
+    return step
+
+
+class DistanceMaps(object):
+    """ Distance maps of a board, cached per sources and search options until the board writes a cell
+        a map depends on; the board calls `invalidate()` from `touch()`. Up to `size` of the most
+        recently used maps are kept.
+
+        Many units chasing the same targets share one map, e.g. AI pieces stepping `downhill()` to the
+        nearest player's piece.
+    """
+    def __init__(self, board, size=16):
+        self.board = board
+        self.size  = size
+        self.maps  = OrderedDict()  # (sources, passable, cross, cost) -> (distances, cells they depend on)
+        self.users = None           # number of cached maps that depend on each cell, indexed by y, x
+
+    def __len__(self):
+        return len(self.maps)
+
+    def get(self, sources, passable=None, cross=False, cost=None):
+        """Distance array from the nearest of `sources`, see `distance_map()`."""
+        board   = self.board
+        sources = frozenset(board.ploc(s) for s in sources)
+        key     = sources, passable or is_blank, cross, cost
+        entry   = self.maps.pop(key, None)
+        if entry is None:
+            if len(self.maps) >= self.size:
+                self.drop(next(iter(self.maps)))
+            entry = distance_map(board, sources, passable, cross, cost)
+            if self.users is None:
+                self.users = np.zeros(entry[1].shape, dtype=np.int32)
+            self.users += entry[1]
+        self.maps[key] = entry
+        return entry[0]
+
+    def drop(self, key):
+        """Drop the map under `key`."""
+        _, seen = self.maps.pop(key)
+        self.users -= seen
+
+    def invalidate(self, loc):
+        """Drop maps that depend on the cell at `loc`."""
+        x, y = loc.x, loc.y
+        if self.users is None or not self.users[y, x]:
+            return
+        for key in [k for k, (_, seen) in self.maps.items() if seen[y, x]]:
+            self.drop(key)
+
+    def clear(self):
+        self.maps.clear()
+        self.users = None
@@ -6,53 +6,145 @@ from itertools import cycle
 from pygame import *
 
 from board import PygameBoard, Loc
+from kinarow import WindowCounts
+from bitboard import Bitboard, Searcher
 from utils import *
 
 game_size = 5
 tilesize  = 100
+win_len   = None    # k-in-a-row mode if set, e.g. 5 for gomoku
+ai_time   = 1.0     # AI search time budget, in seconds
 players   = u'X', u'○'
 ai        = u'○'
 
 
 class TictactoeBoard(PygameBoard):
+    """ Tic-tac-toe board; `make_win_lines()` creates winning lines along with per-line, per-player
+        counters that are updated on each write, so that checking for a win, win moves and an early
+        draw only needs to look at the lines that go through the changed cell.
+
+        Alternatively, `make_windows(k)` switches to k-in-a-row rules (see `kinarow.WindowCounts`).
+    """
+    win_lines = None
+    windows   = None
+
+    def __setitem__(self, loc, player):
+        if isinstance(loc, tuple):
+            loc = self.getloc(*loc)
+        old = self[loc]
+        super(TictactoeBoard, self).__setitem__(loc, player)
+        if self.win_lines is not None:
+            if old is not None    : self.count_lines(loc, old, -1)
+            if player is not None : self.count_lines(loc, player, 1)
+        if self.windows is not None:
+            if old is not None    : self.windows.add(loc.x, loc.y, old, -1)
+            if player is not None : self.windows.add(loc.x, loc.y, player)
+
     def completed(self, line, player):
         """Entire `line` completed by `player`."""
         return all(self[loc] == player for loc in line)
 
+    def won(self, player):
+        """`player` has completed at least one line."""
+        if self.windows is not None:
+            return self.windows.won(player)
+        return bool(self.full.get(player))
+
+    def is_draw(self):
+        """Nobody can win anymore: every line has marks of more than one player."""
+        if self.windows is not None:
+            return self.windows.is_draw()
+        return not self.live_lines
+
     def win_moves(self, player):
         """Yield all win moves for `player`."""
-        for line in self.win_lines:
-            n = sum(self[loc] == player for loc in line)
-            blank = [loc for loc in line if not self[loc]]
-            if len(blank) == 1 and n == game_size-1:
-                yield blank[0]
+        if self.windows is not None:
+            for x, y in self.windows.win_moves(player):
+                yield self.getloc(x, y)
+            return
+
+        for n in self.threats.get(player, ()):
+            for loc in self.win_lines[n]:
+                if self[loc] is None:
+                    yield loc
+                    break
 
     def make_win_lines(self):
-        """Create a list of winning lines."""
+        """Create a list of winning lines and the tables used to track them."""
         winlines, diag1, diag2 = [], [], []
-        size = game_size
+        size, getloc = self.width, self.getloc
 
         for n in range(size):
-            winlines.append( [Loc(m, n) for m in range(size)] )
-            winlines.append( [Loc(n, m) for m in range(size)] )
-
-            diag1.append(Loc(n, n))
-            diag2.append(Loc(size-n-1, n))
-
-        self.win_lines = winlines + [diag1, diag2]
+            winlines.append( [getloc(m, n) for m in range(size)] )
+            winlines.append( [getloc(n, m) for m in range(size)] )
+
+            diag1.append(getloc(n, n))
+            diag2.append(getloc(size-n-1, n))
+
+        self.win_lines  = winlines + [diag1, diag2]
+        self.cell_lines = [[] for _ in range(self.width * self.height)]
+        for n, line in enumerate(self.win_lines):
+            for loc in line:
+                self.cell_lines[loc.y*self.width + loc.x].append(n)
+
+        nlines          = len(self.win_lines)
+        self.counts     = {}                # player -> number of player's marks per line
+        self.nplayers   = [0] * nlines      # number of players with marks on the line
+        self.live_lines = nlines            # lines that have marks of at most one player
+        self.threats    = {}                # player -> lines one move away from completion
+        self.full       = {}                # player -> number of completed lines
+
+        for loc in self.iterlocs():
+            if self[loc] is not None:
+                self.count_lines(loc, self[loc], 1)
+
+    def make_windows(self, k):
+        """Use k-in-a-row rules: `k` marks in a row, column or diagonal anywhere on the board win."""
+        self.windows = WindowCounts(self.width, self.height, k)
+        marks        = set(self[loc] for loc in self.iterlocs()) - set([None])
+        self.windows.load(dict((player, self.plane(player)) for player in marks))
+
+    def count_lines(self, loc, player, delta):
+        """Add `delta` to `player`'s count on all lines that go through `loc`."""
+        size = len(self.win_lines[0])
+        if player not in self.counts:
+            self.counts[player]  = [0] * len(self.win_lines)
+            self.threats[player] = set()
+        counts = self.counts[player]
+
+        for n in self.cell_lines[loc.y*self.width + loc.x]:
+            count = counts[n] = counts[n] + delta
+            if delta > 0 and count == 1:
+                self.nplayers[n] += 1
+                if self.nplayers[n] == 2:
+                    self.live_lines -= 1
+            elif delta < 0 and count == 0:
+                self.nplayers[n] -= 1
+                if self.nplayers[n] == 1:
+                    self.live_lines += 1
+
+            if delta > 0 and count == size:
+                self.full[player] = self.full.get(player, 0) + 1
+            elif delta < 0 and count == size-1:
+                self.full[player] -= 1
+
+            single = self.nplayers[n] == 1
+            for p, pcounts in self.counts.items():
+                if single and pcounts[n] == size-1 : self.threats[p].add(n)
+                else                               : self.threats[p].discard(n)
 
 
 class Tictactoe(object):
-    winmsg  = "%s is the winner!"
-    drawmsg = "It's a draw!"
+    winmsg   = "%s is the winner!"
+    drawmsg  = "It's a draw!"
+    searcher = None
 
     def check_end(self, player):
-        """Check if `player` has won the game; check for a draw."""
-        for line in board.win_lines:
-            if board.completed(line, player):
-                self.game_won(player)
+        """Check if `player` has won the game; check for a draw, including an early one."""
+        if board.won(player):
+            self.game_won(player)
 
-        if board.filled(): self.game_won(None)
+        if board.filled() or board.is_draw(): self.game_won(None)
 
     def game_won(self, winner):
         board.message(self.winmsg % winner if winner else self.drawmsg)
@@ -60,23 +152,52 @@ class Tictactoe(object):
 
     def run(self):
         """Main loop."""
-        board.make_win_lines()
+        if win_len : board.make_windows(win_len)
+        else       : board.make_win_lines()
 
         for player in cycle(players):
             move = self.get_move(player)
             board[move] = player
             self.check_end(player)
 
-    def ai_move(self, player):
+    def ai_move(self, player, cancel=None):
         win_moves = list(board.win_moves(player))
         if win_moves:
             return first(win_moves)
+        elif board.windows is None:
+            return self.search_move(player, cancel)
         else:
-            return board.random_blank()
+            return self.window_move(player)
+
+    def window_move(self, player):
+        """ k-in-a-row move for `player`: block the opponent's win move if there is one, otherwise play
+            the cell that gives the best window score (see `WindowCounts.score()`).
+        """
+        opponent = players[1 - players.index(player)]
+        blocks   = list(board.win_moves(opponent))
+        if blocks:
+            return first(blocks)
+
+        windows, scores = board.windows, {}
+        for loc in board.iterlocs():
+            if board[loc] is None:
+                windows.add(loc.x, loc.y, player)
+                scores[loc] = windows.score(player)
+                windows.add(loc.x, loc.y, player, -1)
+        best = max(scores.values())
+        return randchoice([loc for loc, score in scores.items() if score == best])
+
+    def search_move(self, player, cancel=None):
+        """Best move for `player` found by bitboard search within `ai_time` seconds, or until `cancel` is set."""
+        if not self.searcher:
+            self.searcher = Searcher()
+        bb = Bitboard.from_board(board, players, player)
+        i  = self.searcher.search(bb, ai_time, cancel)
+        return board.getloc(i % board.width, i // board.width)
 
     def get_move(self, player):
         if player == ai:
-            return self.ai_move(player)
+            return board.run_ai(self.ai_move, player, budget=ai_time*2)
         else:
             while True:
                 loc = board.get_click_index()
@@ -87,5 +208,6 @@ class Tictactoe(object):
 if __name__ == "__main__":
     arg = sys.argv[1:]
     if arg: game_size = int(arg[0])
+    if arg[1:]: win_len = int(arg[1])
     board = TictactoeBoard((game_size, game_size))
     Tictactoe().run()
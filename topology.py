@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals, division
+import math
+
+
+class Square(object):
+    """ Geometry of a bounded `width` x `height` square grid: directions, stepping between cells and
+        distances. Boards build their neighbour, step and ray tables from it, once per topology and
+        board size, so other topologies cost the same to use.
+
+        Directions go from up clockwise; 'cross' directions are the non-diagonal ones.
+    """
+    wrap     = False        # steps wrap around board edges
+    dirs     = [(0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)]
+    dirnames = "up ru right rd down ld left lu".split()
+    cross    = 0, 2, 4, 6   # indexes of 'cross' directions in `dirs`
+
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+
+    def step(self, x, y, dir, n=1):
+        """Coordinates `n` steps from `x`, `y` in direction `dir`; they may be outside of the board."""
+        dx, dy = dir
+        return x + dx*n, y + dy*n
+
+    def delta(self, x1, y1, x2, y2):
+        """Offset from the first cell to the second one."""
+        return x2 - x1, y2 - y1
+
+    def shifts(self, dir):
+        """ Board coordinate offsets of the neighbour in `dir` direction from cells in even and in odd rows,
+            before wrapping; used to shift whole planes of cells at once.
+        """
+        return tuple(dir), tuple(dir)
+
+    def dist(self, x1, y1, x2, y2):
+        """Euclidean distance between cell centers."""
+        dx, dy = self.delta(x1, y1, x2, y2)
+        return math.sqrt(dx*dx + dy*dy)
+
+    def steps(self, x1, y1, x2, y2, cross=False):
+        """Fewest steps between two cells with nothing in the way, going in 'cross' directions only with `cross`."""
+        dx, dy = self.delta(x1, y1, x2, y2)
+        return abs(dx) + abs(dy) if cross else max(abs(dx), abs(dy))
+
+
+class Torus(Square):
+    """Square grid with opposite edges joined, so that every step stays on the board."""
+    wrap = True
+
+    def step(self, x, y, dir, n=1):
+        dx, dy = dir
+        return (x + dx*n) % self.width, (y + dy*n) % self.height
+
+    def delta(self, x1, y1, x2, y2):
+        """Shortest offset, possibly across the edges."""
+        w, h   = self.width, self.height
+        dx, dy = (x2 - x1) % w, (y2 - y1) % h
+        return (dx - w if dx > w // 2 else dx), (dy - h if dy > h // 2 else dy)
+
+
+class HexAxial(Square):
+    """ Grid of pointy-top hexes in axial coordinates: x is the diagonal column and y the row, so that the
+        board is a rhombus. Directions go from right-up clockwise and are axial offsets; all six are 'cross'
+        directions. `dist()` is the number of steps.
+    """
+    dirs     = [(1, -1), (1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1)]
+    dirnames = "ru right rd ld left lu".split()
+    cross    = tuple(range(6))
+
+    def axial(self, x, y):
+        """Axial coordinates of the cell at `x`, `y`."""
+        return x, y
+
+    def offset(self, q, r):
+        """Board coordinates of the cell at axial `q`, `r`."""
+        return q, r
+
+    def step(self, x, y, dir, n=1):
+        q, r   = self.axial(x, y)
+        dq, dr = dir
+        return self.offset(q + dq*n, r + dr*n)
+
+    def delta(self, x1, y1, x2, y2):
+        (q1, r1), (q2, r2) = self.axial(x1, y1), self.axial(x2, y2)
+        return q2 - q1, r2 - r1
+
+    def dist(self, x1, y1, x2, y2):
+        return self.steps(x1, y1, x2, y2)
+
+    def steps(self, x1, y1, x2, y2, cross=False):
+        dq, dr = self.delta(x1, y1, x2, y2)
+        return (abs(dq) + abs(dr) + abs(dq + dr)) // 2
+
+
+class HexOffset(HexAxial):
+    """ Grid of pointy-top hexes in 'odd-r' offset coordinates: rows are shifted by half a hex, odd ones to
+        the right, so that the board is a rectangle. Directions are the same axial offsets as in `HexAxial`.
+    """
+    def axial(self, x, y):
+        return x - (y - (y & 1)) // 2, y
+
+    def offset(self, q, r):
+        return q + (r - (r & 1)) // 2, r
+
+    def shifts(self, dir):
+        dq, dr = dir
+        return tuple((self.offset(dq, y + dr)[0], dr) for y in (0, 1))